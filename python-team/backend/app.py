@@ -1,12 +1,38 @@
+import os
+import logging
 from flask import Flask
 from flask_cors import CORS   # 👈 import CORS
+from config import init_db_pool
+from services.llm_client import warm_connection
 from routes.questions import questions_bp
 from routes.skills import skills_bp
 from routes.test import test_bp    # ✅ import test blueprint
+from utils.jsonutil import ORJSONProvider
+
+try:
+    from flask_compress import Compress
+except ImportError:  # optional; responses are just sent uncompressed
+    Compress = None
 
 
 def create_app():
+    # no-op if the server (e.g. gunicorn) already configured the root logger;
+    # LOG_LEVEL=DEBUG turns on the per-request payload dumps in routes/test.py
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
     app = Flask(__name__)
+    # jsonify() / request.get_json() through orjson when it is installed
+    app.json = ORJSONProvider(app)
+    # reject oversized uploads before they are read; file parts above Werkzeug's
+    # 500 KB threshold are spooled to a temp file, other form fields stay in memory
+    app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+    app.config["MAX_FORM_MEMORY_SIZE"] = 2 * 1024 * 1024
+
+    # gzip/br for JSON bodies worth compressing (question sets, listings)
+    app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+    app.config["COMPRESS_LEVEL"] = 4
+    app.config["COMPRESS_MIN_SIZE"] = 1024
+    if Compress is not None:
+        Compress(app)
 
     # ✅ Enable CORS for all routes and all origins
     CORS(app, resources={r"/*": {"origins": "*"}})
@@ -16,6 +42,18 @@ def create_app():
     app.register_blueprint(skills_bp, url_prefix="/ai/v1")
     app.register_blueprint(test_bp, url_prefix="/ai/v1")   # ✅ register test routes
 
+    # gunicorn calls create_app() in each worker after the fork (preload_app is
+    # off), so every worker opens its own pool up front; if the database isn't
+    # reachable yet the pool is created lazily on the first request instead
+    if os.getenv("DB_POOL_WARM", "1") != "0":
+        try:
+            init_db_pool()
+        except Exception as e:
+            logging.getLogger(__name__).warning("database pool not warmed: %s", e)
+    # likewise the first LLM call shouldn't pay for the TLS handshake
+    if os.getenv("LLM_PREWARM", "1") != "0":
+        warm_connection()
+
     @app.route("/")
     def home():
         return {"message": "Backend running"}
@@ -24,5 +62,6 @@ def create_app():
 
 
 if __name__ == "__main__":
+    # local development only; production runs under gunicorn (see gunicorn.conf.py)
     app = create_app()
-    app.run(debug=True, port=5000)
+    app.run(debug=os.getenv("FLASK_DEBUG", "1") == "1", port=5000)
@@ -1,6 +1,11 @@
 import os
+import re
+import threading
+import weakref
+from contextlib import contextmanager
 from dotenv import load_dotenv
-import psycopg2
+from psycopg2 import extensions, extras, pool
+from utils import jsonutil
 
 load_dotenv()
 
@@ -12,5 +17,113 @@ OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL")
 if not OPENROUTER_API_KEY or not OPENROUTER_URL or not OPENROUTER_MODEL:
     raise ValueError("Please set OPENROUTER_API_KEY, OPENROUTER_URL, and OPENROUTER_MODEL in .env")
 
+# decode json/jsonb columns with the faster codec when it is installed
+extras.register_default_json(loads=jsonutil.loads, globally=True)
+extras.register_default_jsonb(loads=jsonutil.loads, globally=True)
+# dict parameters bind as JSON text, encoded with the same codec
+extensions.register_adapter(dict, lambda obj: extras.Json(obj, dumps=jsonutil.dumps))
+
+# per worker process; with several gunicorn workers, or many app servers, put
+# PgBouncer (pool_mode = transaction) in front of Postgres and point
+# DATABASE_URL at it, then set DB_PREPARED_STATEMENTS=0 (see execute_prepared)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "4"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+# how long a request waits for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises as soon as it is exhausted; this makes callers
+# queue for a connection instead
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def _get_pool():
+    """Create the shared connection pool on first use.
+
+    Created lazily so importing this module never opens connections (e.g. in
+    a gunicorn master before workers fork).
+    """
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL)
+    return _db_pool
+
+
+def init_db_pool():
+    """Open the pool's DB_POOL_MIN connections now rather than on the first request.
+
+    Call once per worker process (create_app does). Never call it before a
+    fork: the children would share the parent's sockets.
+    """
+    _get_pool()
+
+
 def get_db_connection():
-    return psycopg2.connect(DATABASE_URL)
\ No newline at end of file
+    """Lease a connection from the pool. Pair every call with release_db_connection().
+
+    Blocks for up to DB_POOL_TIMEOUT seconds when all connections are in use.
+    """
+    if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise pool.PoolError(f"no database connection available after {DB_POOL_TIMEOUT}s")
+    try:
+        return _get_pool().getconn()
+    except Exception:
+        _db_pool_slots.release()
+        raise
+
+
+@contextmanager
+def db_connection():
+    """`with db_connection() as conn:` -- get_db_connection() / release_db_connection() as a block."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
+
+def release_db_connection(conn):
+    """Return a leased connection to the pool, resetting any per-request state."""
+    if conn is None:
+        return
+    discard = bool(conn.closed)
+    if not discard:
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            conn.autocommit = False
+        except Exception:
+            # server went away mid-request: don't hand a dead socket to the next caller
+            discard = True
+    _get_pool().putconn(conn, close=discard)
+    _db_pool_slots.release()
+
+
+# PgBouncer in transaction mode hands each transaction a different server
+# connection, where a statement PREPAREd on another one doesn't exist
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+
+# connection -> names PREPAREd on it; entries vanish with the connection
+_prepared = weakref.WeakKeyDictionary()
+_placeholder = re.compile(r"\$(\d+)")
+
+
+def execute_prepared(cur, name, sql, params):
+    """Execute `sql` (written with $1, $2, ... placeholders) as a named prepared statement.
+
+    The statement is PREPAREd the first time a pooled connection runs it and
+    then reused for the life of that connection, skipping parse/plan on every
+    later call. With DB_PREPARED_STATEMENTS=0 it runs as an ordinary query.
+    """
+    if not DB_PREPARED_STATEMENTS:
+        cur.execute(_placeholder.sub(r"%(p\1)s", sql.replace("%", "%%")),
+                    {f"p{i}": v for i, v in enumerate(params, 1)})
+        return
+    names = _prepared.setdefault(cur.connection, set())
+    if name not in names:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        names.add(name)
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
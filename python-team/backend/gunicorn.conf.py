@@ -0,0 +1,16 @@
+# Production server config. Run from this directory:
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+# and for the results API, from results/:
+#   gunicorn -c ../gunicorn.conf.py "app:create_app()"
+import os
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+# threaded workers: requests waiting on the DB or the LLM API don't hold up
+# the rest of the worker
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# LLM-backed endpoints (generate-test, section evaluation) can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
+accesslog = "-"
@@ -1,6 +1,8 @@
 -- Migration: 001_add_attempt_id.sql
 -- Adds attempt_id column, backfills from results_data JSONB, and creates an index.
 -- Backup your DB before running.
+-- For large tables prefer migrations/run_add_attempt_id.py, which runs the same
+-- steps but commits the backfill in batches instead of one long transaction.
 
 BEGIN;
 
@@ -0,0 +1,12 @@
+-- Migration: 002_assessment_candidates_gin.sql
+-- Indexes the comma-separated assessment_questions.candidate_id list so
+-- /finalise/finalized-test can look a candidate up without a sequential scan.
+-- The expression must stay identical to the one in get_finalized_test.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_assessment_candidates_gin
+  ON assessment_questions
+  USING gin (string_to_array(replace(candidate_id, ' ', ''), ','));
+
+COMMIT;
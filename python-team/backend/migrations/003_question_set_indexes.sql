@@ -0,0 +1,20 @@
+-- Migration: 003_question_set_indexes.sql
+-- B-tree indexes for the per-question-set and per-candidate lookups done on
+-- every test start/submit, so they are index seeks instead of seq scans.
+
+BEGIN;
+
+-- questions by set (start_test, get_questions, section scoring)
+CREATE INDEX IF NOT EXISTS idx_questions_qset ON questions(question_set_id);
+
+-- assessment metadata by set (assessment meta, delete_finalized_test).
+-- Not UNIQUE: older data may hold duplicate rows per set.
+CREATE INDEX IF NOT EXISTS idx_assessment_qset ON assessment_questions(question_set_id);
+
+-- attempt upserts (violations, audio/video upload, submit_section) look up
+-- candidate_id AND question_set_id; the attempts listing orders by created_at
+CREATE INDEX IF NOT EXISTS idx_test_attempts_cand_qset ON test_attempts(candidate_id, question_set_id);
+CREATE INDEX IF NOT EXISTS idx_test_attempts_qset_created ON test_attempts(question_set_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_test_attempts_created ON test_attempts(created_at DESC NULLS LAST);
+
+COMMIT;
@@ -0,0 +1,10 @@
+-- Migration: 004_assessment_created_index.sql
+-- Supports keyset pagination of the finalized-test listings
+-- (?limit=&cursor=), which order by created_at, question_set_id newest first.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_assessment_created_qset
+    ON assessment_questions(created_at DESC NULLS LAST, question_set_id DESC);
+
+COMMIT;
@@ -0,0 +1,49 @@
+-- Migration: 005_finalize_test_full.sql
+-- Server-side finalize: stores the generated_questions row, its
+-- assessment_questions row and every question in one call, so
+-- POST /finalize-test is a single round-trip. The app uses it when present
+-- and falls back to the client-side inserts otherwise.
+--
+--   gq: {"id", "job_id", "title", "description", "duration", "created_at", "expiry_time"}
+--   aq: one key per assessment_questions column (see ASSESSMENT_COLUMNS)
+--   qs: array of question objects, stored as questions.content in order
+--
+-- jsonb_populate_record casts each value to the target column's type.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION finalize_test_full(gq jsonb, aq jsonb, qs jsonb)
+RETURNS text
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO generated_questions (id, job_id, title, description, duration, created_at, expiry_time)
+    SELECT r.id, r.job_id, r.title, r.description, r.duration, r.created_at, r.expiry_time
+    FROM jsonb_populate_record(NULL::generated_questions, gq) r;
+
+    -- same as the client-side SAVEPOINT: a bad assessment value must not
+    -- discard the test itself
+    BEGIN
+        INSERT INTO assessment_questions (
+            question_set_id, title, company, location, work_type, created_at,
+            role_title, skills, experience, work_arrangement, annual_compensation,
+            test_start, test_end, exam_date, end_date, question_type, difficulty, skill, metadata, candidate_id, job_id)
+        SELECT r.question_set_id, r.title, r.company, r.location, r.work_type, r.created_at,
+            r.role_title, r.skills, r.experience, r.work_arrangement, r.annual_compensation,
+            r.test_start, r.test_end, r.exam_date, r.end_date, r.question_type, r.difficulty, r.skill, r.metadata, r.candidate_id, r.job_id
+        FROM jsonb_populate_record(NULL::assessment_questions, aq) r;
+    EXCEPTION WHEN others THEN
+        RAISE WARNING 'finalize_test_full: could not insert assessment_questions: %', SQLERRM;
+    END;
+
+    INSERT INTO questions (question_set_id, content, created_at)
+    SELECT r.question_set_id, r.content, r.created_at
+    FROM jsonb_array_elements(qs) WITH ORDINALITY AS e(q, n),
+         jsonb_populate_record(NULL::questions, jsonb_build_object(
+             'question_set_id', gq->'id', 'content', e.q, 'created_at', gq->'created_at')) r
+    ORDER BY e.n;
+
+    RETURN gq->>'id';
+END;
+$$;
+
+COMMIT;
@@ -0,0 +1,51 @@
+-- Migration: 006_assessment_array_columns.sql
+-- Stores assessment_questions.skills and candidate_id as text[] so the
+-- listings get Python lists back instead of splitting strings per row, and
+-- the candidate lookup is a plain GIN-indexed `candidate_id @> ARRAY[...]`.
+-- The app detects the column types and works before and after this runs;
+-- restart the workers afterwards (the schema is cached per process).
+--
+-- skills was written either as a JSON array string ('["Python","SQL"]') or
+-- as a comma-separated list; both are converted. Safe to re-run.
+
+BEGIN;
+
+-- ALTER ... USING can't contain a subquery, so the JSON case goes through a
+-- session-local helper
+CREATE OR REPLACE FUNCTION pg_temp.text_list_to_array(val text) RETURNS text[]
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN val IS NULL OR btrim(val) = '' THEN NULL
+        WHEN left(btrim(val), 1) = '[' THEN ARRAY(SELECT jsonb_array_elements_text(val::jsonb))
+        ELSE ARRAY(SELECT btrim(item) FROM unnest(string_to_array(val, ',')) AS item
+                   WHERE btrim(item) <> '')
+    END
+$$;
+
+-- the expression index from 002 only works on text: drop it before the type
+-- change, which would otherwise try to rebuild it (replace(text[], ...) doesn't
+-- exist) and abort the migration
+DROP INDEX IF EXISTS idx_assessment_candidates_gin;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'assessment_questions'
+          AND column_name = 'skills') = 'text' THEN
+        ALTER TABLE assessment_questions
+          ALTER COLUMN skills TYPE text[] USING pg_temp.text_list_to_array(skills);
+    END IF;
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'assessment_questions'
+          AND column_name = 'candidate_id') = 'text' THEN
+        ALTER TABLE assessment_questions
+          ALTER COLUMN candidate_id TYPE text[] USING pg_temp.text_list_to_array(candidate_id);
+    END IF;
+END
+$$;
+
+-- the array column is indexed directly instead
+CREATE INDEX IF NOT EXISTS idx_assessment_candidate_ids_gin
+  ON assessment_questions USING gin (candidate_id);
+
+COMMIT;
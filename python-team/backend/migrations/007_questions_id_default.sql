@@ -0,0 +1,18 @@
+-- Migration: 007_questions_id_default.sql
+-- Let Postgres generate question ids, so inserts into `questions` don't have
+-- to send one per row. gen_random_uuid() is built in from PostgreSQL 13; older
+-- servers get it from pgcrypto.
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF current_setting('server_version_num')::int < 130000 THEN
+        CREATE EXTENSION IF NOT EXISTS pgcrypto;
+    END IF;
+END
+$$;
+
+ALTER TABLE questions ALTER COLUMN id SET DEFAULT gen_random_uuid();
+
+COMMIT;
@@ -0,0 +1,25 @@
+-- Migration: 008_test_attempt_sections.sql
+-- Stores each submitted section's evaluations as its own row instead of
+-- appending them to test_attempts.results_data. Appending rewrote the whole
+-- (TOASTed) array on every submission, so bytes written grew quadratically
+-- with the number of sections.
+--
+-- Existing results_data stays where it is; readers return it followed by the
+-- section rows, so the API shape does not change. The app picks the table up
+-- on restart.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS test_attempt_sections (
+    id bigserial PRIMARY KEY,
+    attempt_id uuid NOT NULL REFERENCES test_attempts(id) ON DELETE CASCADE,
+    section_name text,
+    results_data jsonb NOT NULL DEFAULT '[]'::jsonb,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- sections are read back per attempt in submission order
+CREATE INDEX IF NOT EXISTS idx_test_attempt_sections_attempt
+    ON test_attempt_sections(attempt_id, id);
+
+COMMIT;
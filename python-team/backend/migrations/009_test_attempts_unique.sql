@@ -0,0 +1,32 @@
+-- Migration: 009_test_attempts_unique.sql
+-- One attempt row per (candidate_id, question_set_id). Every attempt write
+-- already goes through a single UPDATE-or-INSERT keyed on that pair; the
+-- unique index makes the pair a real key (and usable by ON CONFLICT) in place
+-- of the plain idx_test_attempts_cand_qset from 003.
+--
+-- Older data may hold duplicate pairs from concurrent first writes. Then the
+-- index is not created and a NOTICE lists how many pairs need merging;
+-- resolve them by hand and re-run. Safe to re-run.
+
+BEGIN;
+
+DO $$
+DECLARE
+    dupes bigint;
+BEGIN
+    SELECT count(*) INTO dupes FROM (
+        SELECT 1 FROM test_attempts
+        WHERE candidate_id IS NOT NULL AND question_set_id IS NOT NULL
+        GROUP BY candidate_id, question_set_id
+        HAVING count(*) > 1
+    ) d;
+    IF dupes > 0 THEN
+        RAISE NOTICE 'test_attempts has % duplicate (candidate_id, question_set_id) pairs; uq_ta_cand_qs not created', dupes;
+    ELSE
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_ta_cand_qs ON test_attempts(candidate_id, question_set_id);
+        DROP INDEX IF EXISTS idx_test_attempts_cand_qset;
+    END IF;
+END
+$$;
+
+COMMIT;
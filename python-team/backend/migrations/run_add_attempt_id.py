@@ -1,37 +1,97 @@
 """
-Runner script to execute the migration SQL that adds and backfills attempt_id.
+Runner script to execute the migration that adds and backfills attempt_id.
 Run from the backend directory (python -m migrations.run_add_attempt_id) or directly.
 This script uses the project's `get_db_connection()` in `config` to connect.
+
+It applies the same steps as 001_add_attempt_id.sql, but each step runs in its
+own transaction and the backfill commits every BACKFILL_BATCH rows, so a large
+test_attempts table is never locked by one long transaction. Every step is
+idempotent: re-running after a failure resumes where it stopped.
 """
 import os
 import sys
 
 try:
-    from config import get_db_connection
+    from config import get_db_connection, release_db_connection
 except Exception:
     # In case of path differences, try adjusting import path
     sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-    from config import get_db_connection
+    from config import get_db_connection, release_db_connection
 
-SQL_FILE = os.path.join(os.path.dirname(__file__), '001_add_attempt_id.sql')
+BACKFILL_BATCH = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
 
+ADD_COLUMN_SQL = "ALTER TABLE test_attempts ADD COLUMN IF NOT EXISTS attempt_id text"
+
+# keyset over the primary key: next batch of ids after the last one processed
+NEXT_BATCH_SQL = """
+    SELECT id FROM test_attempts
+    WHERE attempt_id IS NULL AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+FIRST_BATCH_SQL = """
+    SELECT id FROM test_attempts
+    WHERE attempt_id IS NULL
+    ORDER BY id
+    LIMIT %s
+"""
+
+BACKFILL_SQL = """
+    WITH extracted AS (
+      SELECT id,
+             (jsonb_array_elements(results_data) ->> 'attempt_id') AS attempt_id
+      FROM test_attempts
+      WHERE id BETWEEN %s AND %s
+        AND attempt_id IS NULL
+    )
+    UPDATE test_attempts t
+    SET attempt_id = e.attempt_id
+    FROM extracted e
+    WHERE t.id = e.id
+      AND t.attempt_id IS NULL
+      AND e.attempt_id IS NOT NULL
+"""
+
+CREATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_test_attempts_attempt_id ON test_attempts(attempt_id)"
 
-def run():
-    if not os.path.exists(SQL_FILE):
-        print('Migration SQL file not found:', SQL_FILE)
-        return 1
 
-    sql = open(SQL_FILE, 'r', encoding='utf-8').read()
+def backfill(conn, cur):
+    """Copy attempt_id out of results_data, committing once per batch."""
+    last_id = None
+    total = 0
+    while True:
+        if last_id is None:
+            cur.execute(FIRST_BATCH_SQL, (BACKFILL_BATCH,))
+        else:
+            cur.execute(NEXT_BATCH_SQL, (last_id, BACKFILL_BATCH))
+        ids = [r[0] for r in cur.fetchall()]
+        if not ids:
+            conn.commit()
+            return total
+        cur.execute(BACKFILL_SQL, (ids[0], ids[-1]))
+        total += cur.rowcount
+        conn.commit()
+        last_id = ids[-1]
+        print(f'Backfilled {total} rows...')
 
+
+def run():
     conn = None
     cur = None
     try:
         conn = get_db_connection()
-        # allow multi-statement execution
-        conn.autocommit = True
         cur = conn.cursor()
-        print('Executing migration SQL...')
-        cur.execute(sql)
+        print('Adding attempt_id column...')
+        cur.execute(ADD_COLUMN_SQL)
+        conn.commit()
+
+        print('Backfilling attempt_id...')
+        total = backfill(conn, cur)
+        print(f'Backfill done: {total} rows updated.')
+
+        print('Creating index...')
+        cur.execute(CREATE_INDEX_SQL)
+        conn.commit()
         print('Migration executed successfully.')
         return 0
     except Exception as e:
@@ -48,11 +108,7 @@ def run():
                 cur.close()
             except Exception:
                 pass
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        release_db_connection(conn)
 
 
 if __name__ == '__main__':
@@ -8,11 +8,22 @@ def create_app():
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise RuntimeError("Please set DATABASE_URL in environment (or .env)")
-    engine = create_engine(database_url, future=True)
+    # executemany_mode is a psycopg2-dialect option, so pin the driver even if
+    # the URL is a bare postgresql:// (newer SQLAlchemy defaults that to psycopg 3)
+    if database_url.startswith(("postgres://", "postgresql://")):
+        database_url = "postgresql+psycopg2://" + database_url.split("://", 1)[1]
+    engine = create_engine(
+        database_url,
+        future=True,
+        executemany_mode="values_plus_batch",
+        insertmanyvalues_page_size=1000,
+        executemany_batch_page_size=500,
+    )
     app.config["DB_ENGINE"] = engine
     app.register_blueprint(api_bp, url_prefix="/api")
     return app
 
 if __name__ == "__main__":
+    # local development only; production runs under gunicorn (see ../gunicorn.conf.py)
     app = create_app()
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=True)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=os.getenv("FLASK_DEBUG", "1") == "1")
@@ -0,0 +1,94 @@
+from flask import Response, jsonify, stream_with_context
+from sqlalchemy import text
+import csv, io, os, time
+
+def next_cursor(data, has_more):
+    if not has_more or not data:
+        return None
+    return data[-1]["id"]
+
+# filter whitelist only: the handlers return whole rows, so the queries stay
+# SELECT * and pick up schema changes themselves
+TABLE_COLUMNS_TTL = float(os.getenv("TABLE_COLUMNS_TTL", "300"))
+_table_columns = {}
+
+def table_columns(engine, table):
+    """Column names of "public".<table> from information_schema, re-read every TABLE_COLUMNS_TTL seconds."""
+    cached = _table_columns.get(table)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    with engine.connect() as conn:
+        cols = frozenset(conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = 'public' AND table_name = :table"
+        ), {"table": table}).scalars())
+    _table_columns[table] = (time.monotonic() + TABLE_COLUMNS_TTL, cols)
+    return cols
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def fetch_page(engine, sql, params, per_page):
+    """Run a page query that was issued with LIMIT per_page + 1; return (rows, has_more)."""
+    with engine.connect() as conn:
+        rows = conn.execute(sql, params).mappings().all()
+    data = [dict(r) for r in rows[:per_page]]
+    return data, len(rows) > per_page
+
+CSV_FLUSH_BYTES = 64 * 1024
+# rows pulled per round-trip from the server-side cursor during an export
+CSV_FETCH_ROWS = 1000
+
+def stream_csv_response(engine, sql, params, filename):
+    """Stream a query result as CSV using a server-side cursor.
+
+    The connection stays open for the lifetime of the response generator and
+    is closed once the last row has been written (or the client disconnects).
+    """
+    conn = engine.connect()
+    try:
+        # plain Rows are tuples already: csv.writer takes them as-is, no
+        # per-row mapping/dict to build
+        result = conn.execution_options(stream_results=True, yield_per=CSV_FETCH_ROWS).execute(sql, params)
+        first = result.fetchone()
+    except Exception:
+        conn.close()
+        raise
+    if first is None:
+        conn.close()
+        return jsonify({"data": []})
+
+    def generate():
+        try:
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            w.writerow(result.keys())
+            w.writerow(first)
+            for row in result:
+                w.writerow(row)
+                if buf.tell() >= CSV_FLUSH_BYTES:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype="text/csv", headers={"Content-Disposition": f"attachment;filename={filename}"})
+
+def paginated_or_csv(engine, sql, params, export, filename, page, per_page, full=False):
+    """Run a list query; stream it as CSV when exporting, else return one JSON page.
+
+    `sql` must bind :limit and :offset; :limit is set here (per_page + 1 for
+    JSON pages so the extra row tells whether another page exists). With
+    `full`, an export drops the page window (LIMIT NULL) and streams every
+    matching row through the server-side cursor.
+    """
+    if export:
+        if full:
+            params = dict(params, limit=None, offset=0)
+        else:
+            params = dict(params, limit=per_page)
+        return stream_csv_response(engine, sql, params, filename)
+    data, has_more = fetch_page(engine, sql, dict(params, limit=per_page + 1), per_page)
+    return jsonify({"page": page, "per_page": per_page, "data": data, "next_cursor": next_cursor(data, has_more)})
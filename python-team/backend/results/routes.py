@@ -1,6 +1,7 @@
-from flask import Blueprint, request, jsonify, current_app, Response
+from flask import Blueprint, request, jsonify, current_app
 from sqlalchemy import text
-import csv, io
+import functools
+from helpers import table_columns, quote_ident, paginated_or_csv
 
 bp = Blueprint("api_generated", __name__)
 
@@ -22,59 +23,72 @@ def paginate_params():
     if per_page > 100:
         per_page = 100
     offset = (page - 1) * per_page
-    return page, per_page, offset
+    # keyset cursor: id of the last row of the previous page
+    after = request.args.get("after") or None
+    return page, per_page, offset, after
+
+def export_params():
+    """?export=csv streams the current page; add &all=1 to export every matching row."""
+    export = request.args.get("export", "").lower() == "csv"
+    full = export and request.args.get("all", "").lower() in ("1", "true")
+    return export, full
+
+# Statements are cached per (filter set, keyset) so each request reuses
+# a parsed TextClause; the whitelist keeps the number of variants bounded.
+@functools.lru_cache(maxsize=256)
+def results_statement(filter_cols, keyset):
+    # sorted keys + positional bind names: the same filter set always yields
+    # the same SQL text, so the driver/server can reuse the plan
+    where = [f'{quote_ident(col)} = :f{i}' for i, col in enumerate(filter_cols)]
+    if keyset:
+        # seek past the previous page instead of scanning `offset` rows
+        where.append("id < :after")
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    return text(f'SELECT * FROM "public"."results" {where_sql} ORDER BY id DESC LIMIT :limit OFFSET :offset')
+
+@functools.lru_cache(maxsize=2)
+def jobs_statement(keyset):
+    if keyset:
+        return text('SELECT * FROM "public"."interview" WHERE id < :after ORDER BY id DESC LIMIT :limit OFFSET 0')
+    return text('SELECT * FROM "public"."interview" ORDER BY id DESC LIMIT :limit OFFSET :offset')
 
 @bp.route("/results", methods=["GET"])
 def get_results():
     engine = get_engine()
-    page, per_page, offset = paginate_params()
-    export = request.args.get("export", "").lower() == "csv"
+    page, per_page, offset, after = paginate_params()
+    export, full = export_params()
+    requested = {k.split("filter__",1)[1]: v for k, v in request.args.items() if k.startswith("filter__")}
+    try:
+        # the column lookup is only needed to check filters
+        columns = table_columns(engine, "results") if requested else ()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    where = []
-    params = {}
-    for k, v in request.args.items():
-        if k.startswith("filter__"):
-            col = k.split("filter__",1)[1]
-            where.append(f'"{col}" = :{col}')
-            params[col] = v
+    # only real columns may be interpolated into the SQL
+    filters = {col: v for col, v in requested.items() if col in columns}
 
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-    sql = text(f'SELECT * FROM "public"."results" {where} ORDER BY 1 DESC LIMIT :limit OFFSET :offset'.replace("{where}", where_sql))
-    params.update({"limit": per_page, "offset": offset})
+    filter_cols = tuple(sorted(filters))
+    params = {f"f{i}": filters[col] for i, col in enumerate(filter_cols)}
+    if after is not None:
+        params["after"] = after
+        offset = 0
+    params["offset"] = offset
+    sql = results_statement(filter_cols, after is not None)
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(sql, params).mappings().all()
-            data = [dict(r) for r in rows]
-            if export:
-                if not data:
-                    return jsonify({"data": []})
-                output = io.StringIO()
-                w = csv.DictWriter(output, fieldnames=list(data[0].keys()))
-                w.writeheader()
-                w.writerows(data)
-                return Response(output.getvalue(), mimetype="text/csv", headers={"Content-Disposition":"attachment;filename=results.csv"})
-            return jsonify({"page": page, "per_page": per_page, "data": data})
+        return paginated_or_csv(engine, sql, params, export, "results.csv", page, per_page, full)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @bp.route("/jobs", methods=["GET"])
 def get_jobs():
     engine = get_engine()
-    page, per_page, offset = paginate_params()
-    export = request.args.get("export", "").lower() == "csv"
-    sql = text(f'SELECT * FROM "public"."interview" ORDER BY 1 DESC LIMIT :limit OFFSET :offset')
+    page, per_page, offset, after = paginate_params()
+    export, full = export_params()
+    params = {"offset": offset}
+    if after is not None:
+        params["after"] = after
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(sql, {"limit": per_page, "offset": offset}).mappings().all()
-            data = [dict(r) for r in rows]
-            if export:
-                if not data:
-                    return jsonify({"data": []})
-                output = io.StringIO()
-                w = csv.DictWriter(output, fieldnames=list(data[0].keys()))
-                w.writeheader()
-                w.writerows(data)
-                return Response(output.getvalue(), mimetype="text/csv", headers={"Content-Disposition":"attachment;filename=jobs.csv"})
-            return jsonify({"page": page, "per_page": per_page, "data": data})
+        sql = jobs_statement(after is not None)
+        return paginated_or_csv(engine, sql, params, export, "jobs.csv", page, per_page, full)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -2,65 +2,137 @@
 # Backend route handlers for question generation and finalization
 
 from flask import Blueprint, request, jsonify
+from psycopg2.extras import execute_values
 from services.generator import generate_questions
+from services.jobs import submit_job, get_job
 import traceback
-from config import get_db_connection
-from utils.ids import gen_uuid
+from config import get_db_connection, release_db_connection, db_connection, execute_prepared
+from utils.ids import gen_uuid, parse_uuid
+from utils.timeutil import utcnow
+from utils import jsonutil
+from utils.jsonutil import json_response
+from utils.cache import TTLCache
 import datetime
+import os
 import json
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 questions_bp = Blueprint("questions", __name__)
 
+# assessment metadata is effectively immutable per question_set_id; misses are
+# not cached so a freshly finalized test is visible right away
+_assessment_meta_cache = TTLCache(ttl=int(os.getenv("ASSESSMENT_CACHE_TTL", "60")), maxsize=2048)
+
+# (column, response key) for the listing endpoints, in SELECT order
+ASSESSMENT_LIST_FIELDS = (
+    ("title", "title"), ("work_type", "workType"), ("created_at", "createdAt"),
+    ("candidate_id", "candidate_id"), ("job_id", "job_id"), ("company", "company"),
+    ("skills", "skills"), ("location", "location"), ("question_set_id", "question_set_id"),
+    ("exam_date", "exam_date"), ("end_date", "end_date"), ("test_end", "test_end"),
+    ("test_start", "test_start"),
+)
+ASSESSMENT_LIST_KEYS = tuple(key for _col, key in ASSESSMENT_LIST_FIELDS)
+ASSESSMENT_PAGE_MAX = 200
+
+
+def _assessment_row(row):
+    test = dict(zip(ASSESSMENT_LIST_KEYS, row))
+    created_at = test["createdAt"]
+    test["createdAt"] = created_at.isoformat() if created_at else None
+    # text[] columns already come back as lists; legacy text is comma-separated
+    skills_val = test["skills"]
+    if isinstance(skills_val, str):
+        test["skills"] = [s.strip() for s in skills_val.split(",") if s.strip()]
+    elif not isinstance(skills_val, list):
+        test["skills"] = []
+    return test
+
+
+def _assessment_page_args():
+    """Parse ?limit=&cursor= for the assessment listings.
+
+    Without `limit` the full list is returned, as before. With it, rows come
+    newest first and the X-Next-Cursor response header carries the cursor for
+    the next page (absent on the last page).
+    """
+    limit = request.args.get("limit")
+    if limit is None:
+        return None, None
+    limit = max(1, min(int(limit), ASSESSMENT_PAGE_MAX))
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return limit, None
+    created, qset = cursor.split("|", 1)
+    return limit, (datetime.datetime.fromisoformat(created) if created else None, qset)
+
+
+def _assessment_select(cur):
+    # candidate_id goes out as the comma-separated string either way
+    if "candidate_id" in assessment_array_columns(cur):
+        return ", ".join("array_to_string(candidate_id, ',') AS candidate_id" if col == "candidate_id" else col
+                         for col, _key in ASSESSMENT_LIST_FIELDS)
+    return ", ".join(col for col, _key in ASSESSMENT_LIST_FIELDS)
+
+
+def _assessment_page_sql(cur, where, params, limit, after):
+    # keyset on (created_at, question_set_id); undated legacy rows sort last
+    conds = [where] if where else []
+    if after is not None:
+        created, qset = after
+        if created is None:
+            conds.append("created_at IS NULL AND question_set_id < %s")
+            params = params + [qset]
+        else:
+            conds.append("((created_at, question_set_id) < (%s, %s) OR created_at IS NULL)")
+            params = params + [created, qset]
+    sql = f"SELECT {_assessment_select(cur)} FROM assessment_questions"
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    if limit is not None:
+        sql += " ORDER BY created_at DESC NULLS LAST, question_set_id DESC LIMIT %s"
+        params = params + [limit + 1]
+    return sql, params
+
+
+def _assessment_page_response(out, limit):
+    headers = {}
+    if limit is not None and len(out) > limit:
+        del out[limit:]
+        last = out[-1]
+        headers["X-Next-Cursor"] = f"{last['createdAt'] or ''}|{last['question_set_id']}"
+    return out, headers
+
+
 @questions_bp.route("/finalise/finalized-test", methods=["GET"])
 def get_finalized_test():
     candidate_id = request.args.get("candidateId")
+    try:
+        limit, after = _assessment_page_args()
+    except ValueError:
+        return jsonify({"error": "invalid limit or cursor"}), 400
     conn = None
+    cur = None
     try:
         conn = get_db_connection()
+        # read-only: skip the implicit BEGIN / idle-in-transaction
+        conn.autocommit = True
         cur = conn.cursor()
-        cur.execute("""
-            SELECT title, work_type, created_at, candidate_id, job_id, company, skills, location, question_set_id, exam_date, end_date, test_end, test_start
-            FROM assessment_questions
-        """)
-        rows = cur.fetchall()
-        matching_tests = []
-        for row in rows:
-            db_candidate_ids = row[3]
-            if not db_candidate_ids:
-                continue
-            candidate_id_list = [cid.strip() for cid in str(db_candidate_ids).split(",") if cid.strip()]
-            if candidate_id not in candidate_id_list:
-                continue
-
-            skills_val = row[6]
-            if isinstance(skills_val, str):
-                skills_list = [s.strip() for s in skills_val.split(",") if s.strip()]
-            else:
-                skills_list = []
-
-            test = {
-                "title": row[0],
-                "workType": row[1],
-                "createdAt": row[2].isoformat() if row[2] else None,
-                "candidate_id": row[3],
-                "job_id": row[4],
-                "company": row[5],
-                "skills": skills_list,
-                "location": row[7],
-                "question_set_id": row[8],
-                "exam_date": row[9],
-                "end_date": row[10],
-                "test_end": row[11],
-                "test_start": row[12]
-            }
-            matching_tests.append(test)
-
-        if matching_tests:
-            return jsonify(matching_tests), 200
+        # match the candidate in SQL; both forms are covered by a GIN index
+        # (idx_assessment_candidates_gin on the expression, or on the text[]
+        # column after migration 006)
+        if "candidate_id" in assessment_array_columns(cur):
+            where = "candidate_id @> ARRAY[%s]::text[]"
+        else:
+            where = "string_to_array(replace(candidate_id, ' ', ''), ',') @> ARRAY[%s]::text[]"
+        sql, params = _assessment_page_sql(cur, where, [candidate_id], limit, after)
+        cur.execute(sql, params)
+        matching_tests, headers = _assessment_page_response(
+            [_assessment_row(row) for row in cur], limit)
+
+        if matching_tests or after is not None:
+            return jsonify(matching_tests), 200, headers
 
         # empty result
         return jsonify([{
@@ -83,8 +155,7 @@ def get_finalized_test():
                 cur.close()
         except Exception:
             pass
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 @questions_bp.route("/finalise/finalized-test/<question_set_id>", methods=["DELETE"])
 def delete_finalized_test(question_set_id):
@@ -99,90 +170,90 @@ def delete_finalized_test(question_set_id):
         """, (question_set_id,))
         deleted = cur.rowcount
         conn.commit()
+        _assessment_meta_cache.delete(question_set_id)
         if deleted:
             return jsonify({"message": "Deleted"}), 200
         else:
             return jsonify({"error": "Not found"}), 404
     except Exception as e:
-        print("Error deleting assessment:", e)
+        logger.exception("Error deleting assessment %s", question_set_id)
         if conn:
             conn.rollback()
         return jsonify({"error": str(e)}), 500
     finally:
-        if conn: conn.close()
+        release_db_connection(conn)
 
 @questions_bp.route("/question-set/<question_set_id>/assessment", methods=["GET"])
 def get_assessment_by_qset(question_set_id):
     """Return basic assessment metadata (title, role_title, company) for a question_set_id."""
-    conn = None
+    cached = _assessment_meta_cache.get(question_set_id)
+    if cached is not None:
+        return jsonify(cached), 200
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT title, role_title, company FROM assessment_questions WHERE question_set_id = %s LIMIT 1", (question_set_id,))
-        row = cur.fetchone()
+        with db_connection() as conn, conn.cursor() as cur:
+            execute_prepared(cur, "assessment_by_qset",
+                             "SELECT title, role_title, company FROM assessment_questions WHERE question_set_id = $1 LIMIT 1",
+                             (question_set_id,))
+            row = cur.fetchone()
         if not row:
             return jsonify({"status": "error", "message": "Not found"}), 404
 
         title, role_title, company = row
-        return jsonify({
+        meta = {
             "status": "success",
             "title": title,
             "role_title": role_title,
             "company": company
-        }), 200
+        }
+        _assessment_meta_cache.set(question_set_id, meta)
+        return jsonify(meta), 200
     except Exception as e:
-        print(f"Error fetching assessment metadata: {e}")
+        logger.exception("Error fetching assessment metadata for %s", question_set_id)
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 
 @questions_bp.route("/finalise/finalized-tests", methods=["GET"])
 def get_all_finalized_tests():
-    """Return all finalized tests (no candidateId filter)."""
+    """Return all finalized tests (no candidateId filter); ?limit=&cursor= pages them."""
+    try:
+        limit, after = _assessment_page_args()
+    except ValueError:
+        return jsonify({"error": "invalid limit or cursor"}), 400
     conn = None
+    cur = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT title, work_type, created_at, candidate_id, job_id, company, skills, location, question_set_id, exam_date, end_date, test_end, test_start
-            FROM assessment_questions
-        """)
-        rows = cur.fetchall()
-        out = []
-        for row in rows:
-            # parse skills into list when stored as comma-separated string
-            skills_val = row[6]
-            if skills_val:
-                if isinstance(skills_val, str):
-                    skills_list = [s.strip() for s in skills_val.split(",") if s.strip()]
-                else:
-                    skills_list = skills_val if isinstance(skills_val, list) else []
-            else:
-                skills_list = []
-
-            out.append({
-                "title": row[0],
-                "workType": row[1],
-                "createdAt": row[2].isoformat() if row[2] else None,
-                "candidate_id": row[3],
-                "job_id": row[4],
-                "company": row[5],
-                "skills": skills_list,
-                "location": row[7],
-                "question_set_id": row[8],
-                "exam_date": row[9],
-                "end_date": row[10],
-                "test_end": row[11],
-                "test_start": row[12]
-            })
-
-        return jsonify(out), 200
+        with conn.cursor() as schema_cur:
+            sql, params = _assessment_page_sql(schema_cur, None, [], limit, after)
+        if limit is None:
+            # unpaged listing: server-side cursor so rows arrive in batches
+            # instead of materializing the whole table in one fetch
+            cur = conn.cursor(name="assessment_list")
+            cur.itersize = 200
+        else:
+            cur = conn.cursor()
+        cur.execute(sql, params)
+        out, headers = _assessment_page_response([_assessment_row(row) for row in cur], limit)
+        resp = json_response(out)
+        resp.headers.update(headers)
+        # let clients revalidate the (slow-changing) list with If-None-Match
+        # and get an empty 304 when nothing changed
+        resp.cache_control.private = True
+        resp.cache_control.max_age = 15
+        resp.cache_control.must_revalidate = True
+        resp.add_etag()
+        return resp.make_conditional(request)
     except Exception as e:
-        print("Error fetching all assessments:", e)
+        logger.exception("Error fetching all assessments")
         return jsonify({"error": str(e)}), 500
     finally:
-        if conn: conn.close()
+        try:
+            if cur:
+                cur.close()
+        except Exception:
+            pass
+        release_db_connection(conn)
 
 
 @questions_bp.route("/generate-test", methods=["POST"])
@@ -193,6 +264,16 @@ def generate_test():
     if not data or "skills" not in data:
         return jsonify({"error": "Invalid request, missing skills"}), 400
 
+    # opt-in: ?async=1 or "Prefer: respond-async" returns 202 and a job to poll,
+    # so the worker isn't held for the whole LLM round-trip
+    if request.args.get("async") in ("1", "true") or "respond-async" in request.headers.get("Prefer", ""):
+        try:
+            job_id = submit_job(generate_questions, data, True, with_progress=True)
+        except Exception as e:
+            logger.exception("Error queueing test generation")
+            return jsonify({"status": "error", "message": str(e)}), 500
+        return jsonify({"status": "queued", "job_id": job_id}), 202
+
     try:
         questions = generate_questions(data)
         return jsonify({"status": "success", "questions": questions}), 200
@@ -200,13 +281,34 @@ def generate_test():
         logger.exception("Error generating test")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@questions_bp.route("/generate-test/<job_id>", methods=["GET"])
+def generate_test_status(job_id):
+    """Poll a job started with /generate-test?async=1"""
+    try:
+        job = get_job(job_id)
+    except Exception as e:
+        logger.exception("Error reading job %s", job_id)
+        return jsonify({"status": "error", "message": str(e)}), 500
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown or expired job"}), 404
+    if job["state"] == "done":
+        return jsonify({"status": "success", "job_id": job_id, "questions": job["result"]}), 200
+    if job["state"] == "failed":
+        return jsonify({"status": "error", "job_id": job_id, "message": job["error"]}), 500
+    return jsonify({"status": job["state"], "job_id": job_id, "progress": job["progress"]}), 202
+
 @questions_bp.route("/question-set/<question_set_id>/questions", methods=["GET"])
 def get_questions(question_set_id):
+    if not parse_uuid(question_set_id):
+        return jsonify({"status": "error", "message": "question_set_id must be a UUID"}), 400
     conn = None
+    cur = None
     try:
         conn = get_db_connection()
+        conn.autocommit = True
         cur = conn.cursor()
-        cur.execute("SELECT content FROM questions WHERE question_set_id = %s", (question_set_id,))
+        execute_prepared(cur, "questions_by_qset",
+                         "SELECT content FROM questions WHERE question_set_id = $1", (question_set_id,))
         rows = cur.fetchall()
         questions = []
         for r in rows:
@@ -215,11 +317,11 @@ def get_questions(question_set_id):
                 questions.append(val)
             else:
                 try:
-                    questions.append(json.loads(val))
+                    questions.append(jsonutil.loads(val))
                 except Exception:
                     questions.append(val)
 
-        return jsonify({"status": "success", "question_set_id": question_set_id, "questions": questions}), 200
+        return json_response({"status": "success", "question_set_id": question_set_id, "questions": questions})
     except Exception as e:
         logger.exception("Error fetching questions for question_set_id=%s", question_set_id)
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -229,36 +331,156 @@ def get_questions(question_set_id):
                 cur.close()
         except Exception:
             pass
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def convert_ampm_to_24h(time_str):
+    """'09:30 PM' -> '21:30'; None if the value is not a valid 12-hour time."""
     if not time_str:
         return None
+    # hand-rolled: strptime goes through regex + locale lookup on every call
     try:
-        time_str = time_str.strip().upper()
-        in_time = datetime.datetime.strptime(time_str, "%I:%M %p")
-        return in_time.strftime("%H:%M")
+        hm, meridiem = time_str.upper().split()
+        hours, minutes = hm.split(":")
+        h, m = int(hours), int(minutes)
     except ValueError:
         return None
+    if not (hours.isdigit() and minutes.isdigit() and len(hours) <= 2 and len(minutes) <= 2):
+        return None
+    if not (1 <= h <= 12 and m <= 59) or meridiem not in ("AM", "PM"):
+        return None
+    h %= 12
+    if meridiem == "PM":
+        h += 12
+    return f"{h:02d}:{m:02d}"
+
+GENERATED_INSERT_SQL = """
+    INSERT INTO generated_questions (id, job_id, title, description, duration, created_at, expiry_time)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+# older generated_questions tables have no title/description columns
+GENERATED_INSERT_BASIC_SQL = """
+    INSERT INTO generated_questions (id, job_id, duration, created_at, expiry_time)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+ASSESSMENT_COLUMNS = (
+    "question_set_id", "title", "company", "location", "work_type", "created_at",
+    "role_title", "skills", "experience", "work_arrangement", "annual_compensation",
+    "test_start", "test_end", "exam_date", "end_date", "question_type", "difficulty", "skill", "metadata", "candidate_id", "job_id",
+)
+ASSESSMENT_INSERT_SQL = (
+    "INSERT INTO assessment_questions (" + ", ".join(ASSESSMENT_COLUMNS) + ") "
+    "VALUES (" + ", ".join(["%s"] * len(ASSESSMENT_COLUMNS)) + ")"
+)
+
+_column_types = {}
+
+def column_types(cur, table):
+    """{column: data_type} for `table`, read from information_schema once per process."""
+    types = _column_types.get(table)
+    if types is None:
+        cur.execute("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+        """, (table,))
+        types = dict(cur.fetchall())
+        _column_types[table] = types
+    return types
+
+def table_columns(cur, table):
+    """Column names of `table` (cached, see column_types)."""
+    return frozenset(column_types(cur, table))
+
+def assessment_array_columns(cur):
+    """Which of skills/candidate_id are text[] (migration 006) rather than text."""
+    return {col for col, typ in column_types(cur, "assessment_questions").items()
+            if typ == "ARRAY" and col in ("skills", "candidate_id")}
+
+GENERATED_COLUMNS = ("id", "job_id", "title", "description", "duration", "created_at", "expiry_time")
+FINALIZE_FUNCTION_SQL = "SELECT finalize_test_full(%s::jsonb, %s::jsonb, %s::jsonb)"
+
+_has_finalize_function = None
+
+def has_finalize_function(cur):
+    """Whether migration 005 (finalize_test_full) is installed; checked once per process."""
+    global _has_finalize_function
+    if _has_finalize_function is None:
+        cur.execute("SELECT to_regprocedure('finalize_test_full(jsonb,jsonb,jsonb)') IS NOT NULL")
+        _has_finalize_function = cur.fetchone()[0]
+    return _has_finalize_function
+
+def _finalize_in_db(cur, generated_params, assessment_params, question_json):
+    """Store the whole test with one finalize_test_full() call."""
+    def encode(columns, params):
+        return jsonutil.dumps({col: val.isoformat() if isinstance(val, datetime.datetime) else val
+                               for col, val in zip(columns, params)})
+
+    cur.execute(FINALIZE_FUNCTION_SQL, (
+        encode(GENERATED_COLUMNS, generated_params),
+        encode(ASSESSMENT_COLUMNS, assessment_params),
+        "[" + ",".join(question_json) + "]",
+    ))
+    cur.fetchone()
+
+def _insert_test_metadata(cur, generated_params, assessment_params):
+    """Insert the generated_questions row and, when possible, its assessment_questions row.
+
+    The statements are picked from the cached table schema instead of probing
+    with a failing INSERT.
+    """
+    if {"title", "description"} <= table_columns(cur, "generated_questions"):
+        gq_sql, gq_params = GENERATED_INSERT_SQL, generated_params
+    else:
+        question_set_id, job_id, _title, _description, total_duration, created_at, expiry_time = generated_params
+        gq_sql, gq_params = GENERATED_INSERT_BASIC_SQL, (question_set_id, job_id, total_duration, created_at, expiry_time)
+
+    if not set(ASSESSMENT_COLUMNS) <= table_columns(cur, "assessment_questions"):
+        logger.warning("assessment_questions is missing columns; storing generated_questions only")
+        cur.execute(gq_sql, gq_params)
+        return
+
+    # Both rows in one round-trip: the writable CTE runs even though the outer
+    # INSERT doesn't reference it. The savepoint rides in the same batch so a
+    # bad assessment value (e.g. a type mismatch) doesn't discard the test.
+    try:
+        cur.execute("SAVEPOINT test_metadata; WITH gq AS (" + gq_sql + ") " + ASSESSMENT_INSERT_SQL,
+                    gq_params + assessment_params)
+        logger.debug("generated_questions and assessment_questions inserted")
+    except Exception as aq_error:
+        logger.warning("Could not insert into assessment_questions: %s", aq_error)
+        cur.execute("ROLLBACK TO SAVEPOINT test_metadata")
+        cur.execute(gq_sql, gq_params)
+
+def _validate_question(i, q):
+    """Raise ValueError if question `i` (1-based) can't be stored."""
+    if not isinstance(q, dict):
+        raise ValueError(f"Question {i} must be an object, got {type(q)}")
+
+    required_fields = ["type", "skill", "difficulty", "content"]
+    missing_fields = [field for field in required_fields if field not in q]
+    if missing_fields:
+        raise ValueError(f"Question {i} missing required fields: {missing_fields}")
+
+    if not isinstance(q["content"], dict):
+        raise ValueError(f"Question {i} content must be a dictionary, got {type(q['content'])}")
+
+    logger.debug("Question %d: type=%s skill=%s difficulty=%s", i, q["type"], q["skill"], q["difficulty"])
 
 @questions_bp.route("/finalize-test", methods=["POST"])
 def finalize_test():
     """Finalize test and store in database"""
-    print("\n" + "="*50)
-    print("BACKEND: FINALIZE TEST REQUEST RECEIVED")
-    print("="*50)
-    
     data = request.get_json()
 
     if not data:
         logger.error("No data received in finalize_test request")
         return jsonify({"error": "No data received"}), 400
 
-    logger.info("Finalize test request received, keys=%s", list(data.keys()))
+    logger.debug("Finalize test request received, keys=%s", list(data.keys()))
     
     if "questions" not in data:
-        logger.error("Missing 'questions' in request data: %s", json.dumps(data)[:200])
+        logger.error("Missing 'questions' in request data, keys=%s", list(data.keys()))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request data: %s", json.dumps(data)[:200])
         return jsonify({"error": "Invalid request, missing questions"}), 400
 
     questions = data["questions"]
@@ -270,37 +492,45 @@ def finalize_test():
         logger.error("Questions array is empty")
         return jsonify({"error": "Questions array is empty"}), 400
 
-    logger.info("Number of questions received: %d", len(questions))
+    logger.debug("Number of questions received: %d", len(questions))
     
     # Extract test metadata
     test_title = data.get("test_title", "Untitled Test")
     test_description = data.get("test_description", "")
     job_id = data.get("job_id")
 
-    logger.info("Test Title: %s; job_id=%s", test_title, job_id)
+    logger.debug("Test Title: %s; job_id=%s", test_title, job_id)
     
     # Log first question structure for debugging
-    if questions:
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug("First question structure: %s", json.dumps(questions[0]))
 
+    # reject bad payloads before generating ids or acquiring a connection
+    try:
+        for i, q in enumerate(questions, 1):
+            _validate_question(i, q)
+    except ValueError as ve:
+        logger.error("VALIDATION ERROR: %s", ve)
+        return jsonify({"status": "error", "message": str(ve), "error": "Validation failed"}), 400
+
     conn = None
     cur = None
     try:
-        logger.info("Connecting to database")
-        conn = get_db_connection()
-        cur = conn.cursor()
-        logger.info("Database connection successful")
-
         # Generate unique question_set_id
         question_set_id = gen_uuid()
-        logger.info("Generated question_set_id: %s", question_set_id)
-        
-        # Calculate total duration
-        total_duration = sum(q.get("time_limit", 60) for q in questions)
-        logger.info("Calculated total duration: %s seconds", total_duration)
+        logger.debug("Generated question_set_id: %s", question_set_id)
 
         # Set timestamps
-        created_at = datetime.datetime.utcnow()
+        created_at = utcnow()
+
+        # Serialize questions, summing the duration in the same pass
+        rows = []
+        total_duration = 0
+        logger.debug("Processing %d questions", len(questions))
+        for q in questions:
+            total_duration += q.get("time_limit", 60)
+            rows.append((question_set_id, jsonutil.dumps(q), created_at))
+        logger.debug("Calculated total duration: %s seconds", total_duration)
 
         # ✅ Use user selected end date/time if provided
         exam_date = data.get("startDate")
@@ -322,29 +552,16 @@ def finalize_test():
         else:
             expiry_time = created_at + datetime.timedelta(hours=48)
 
-        logger.info("Expiry time calculated: %s (end_time_24=%s)", expiry_time, end_time_24)
+        logger.debug("Expiry time calculated: %s (end_time_24=%s)", expiry_time, end_time_24)
+
+        logger.debug("Connecting to database")
+        conn = get_db_connection()
+        # the schema checks and the finalize_test_full() call are single
+        # statements; only the client-side fallback needs a transaction
+        conn.autocommit = True
+        cur = conn.cursor()
+        logger.debug("Database connection successful")
 
-        # Insert into generated_questions table
-        logger.info("Inserting into generated_questions table")
-        try:
-            # Try with title and description columns
-            cur.execute("""
-                INSERT INTO generated_questions (id, job_id, title, description, duration, created_at, expiry_time)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (question_set_id, job_id, test_title, test_description, total_duration, created_at, expiry_time))
-            logger.info("generated_questions inserted with title and description")
-        except Exception as col_error:
-            logger.warning("Could not insert with title/description: %s", col_error)
-            logger.info("Attempting fallback insert without title/description")
-            conn.rollback()
-            cur.execute("""
-                INSERT INTO generated_questions (id, job_id, duration, created_at, expiry_time)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (question_set_id, job_id, total_duration, created_at, expiry_time))
-            logger.info("generated_questions inserted (basic format)")
-
-        # Insert into assessment_questions table
-        logger.info("Inserting into assessment_questions table")
         company = data.get("company", "Unknown Company")
         location = data.get("location", "Remote")
         work_type = data.get("workType", "Full-time")
@@ -354,74 +571,53 @@ def finalize_test():
         experience = data.get("experience")
         work_arrangement = data.get("work_arrangement")
         annual_compensation = data.get("annual_compensation")
-        test_start = data.get("test_start")
-        test_end = data.get("test_end")
         question_type = data.get("question_type")
         difficulty = data.get("difficulty")
         skill = data.get("skill")
         metadata = data.get("metadata")
         candidate_id = data.get("candidate_ids")
-        job_id = data.get("job_id")
-
-        try:
-            cur.execute("""
-                INSERT INTO assessment_questions (
-                    question_set_id, title, company, location, work_type, created_at,
-                    role_title, skills, experience, work_arrangement, annual_compensation,
-                    test_start, test_end, exam_date, end_date, question_type, difficulty, skill, metadata, candidate_id, job_id
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                )
-            """,
-            (
-                question_set_id, test_title, company, location, work_type, created_at,
-                role_title, json.dumps(skills) if skills is not None else None, experience, work_arrangement, annual_compensation,
-                start_time, end_time, exam_date, end_date, question_type, difficulty, skill, metadata, candidate_id, job_id
-            ))
-            logger.info("assessment_questions inserted with all fields")
-        except Exception as aq_error:
-            logger.warning("Could not insert into assessment_questions: %s", aq_error)
-            conn.rollback()
-
-        # Insert questions
-        logger.info("Processing %d questions", len(questions))
-        for i, q in enumerate(questions, 1):
-            logger.debug("Processing question %d/%d", i, len(questions))
-
-            required_fields = ["type", "skill", "difficulty", "content"]
-            missing_fields = [field for field in required_fields if field not in q]
-            if missing_fields:
-                error_msg = f"Question {i} missing required fields: {missing_fields}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-
-            if not isinstance(q["content"], dict):
-                error_msg = f"Question {i} content must be a dictionary, got {type(q['content'])}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
 
-            logger.debug("Question %d: type=%s skill=%s difficulty=%s", i, q["type"], q["skill"], q["difficulty"])
-
-            question_id = q.get("question_id", gen_uuid())
+        if "skills" in assessment_array_columns(cur):
+            if isinstance(skills, str):
+                skills = [s.strip() for s in skills.split(",") if s.strip()]
+        elif skills is not None:
+            skills = json.dumps(skills)
+        if "candidate_id" in assessment_array_columns(cur) and isinstance(candidate_id, str):
+            candidate_id = [c.strip() for c in candidate_id.split(",") if c.strip()]
+
+        generated_params = (question_set_id, job_id, test_title, test_description, total_duration, created_at, expiry_time)
+        assessment_params = (
+            question_set_id, test_title, company, location, work_type, created_at,
+            role_title, skills, experience, work_arrangement, annual_compensation,
+            start_time, end_time, exam_date, end_date, question_type, difficulty, skill, metadata, candidate_id, job_id
+        )
+
+        if has_finalize_function(cur) and set(ASSESSMENT_COLUMNS) <= table_columns(cur, "assessment_questions") \
+                and {"title", "description"} <= table_columns(cur, "generated_questions"):
+            # everything in one round-trip, committed by the statement itself
+            _finalize_in_db(cur, generated_params, assessment_params, [r[1] for r in rows])
+            logger.debug("Test stored via finalize_test_full")
+        else:
+            conn.autocommit = False
+            _insert_test_metadata(cur, generated_params, assessment_params)
 
+            # Insert all questions in a single round-trip
             try:
-                cur.execute("""
+                execute_values(cur, """
                     INSERT INTO questions (
                         question_set_id, content, created_at
                     )
-                    VALUES (%s, %s, %s)
-                """, (str(question_set_id), json.dumps(q), created_at))
-                logger.debug("Question %d inserted", i)
-            except Exception as insert_error:
-                logger.exception("Error inserting question %d", i)
+                    VALUES %s
+                """, rows, page_size=500)
+                logger.debug("%d questions inserted", len(rows))
+            except Exception:
+                logger.exception("Error inserting questions")
                 raise
 
-        logger.info("Committing transaction")
-        conn.commit()
+            logger.debug("Committing transaction")
+            conn.commit()
+            logger.debug("Transaction committed successfully")
         cur.close()
-        logger.info("Transaction committed successfully")
 
         logger.info("SUCCESS: Test '%s' finalized, question_set_id=%s, stored=%d", test_title, question_set_id, len(questions))
 
@@ -436,7 +632,7 @@ def finalize_test():
     except Exception as e:
         logger.exception("ERROR finalizing test")
         if conn:
-            logger.info("Rolling back transaction")
+            logger.debug("Rolling back transaction")
             conn.rollback()
         return jsonify({"status": "error", "message": str(e), "error": "Database operation failed"}), 500
 
@@ -446,7 +642,6 @@ def finalize_test():
                 cur.close()
         except Exception:
             pass
-        if conn:
-            logger.info("Closing database connection")
-            conn.close()
-        logger.info("finalize_test complete")
\ No newline at end of file
+        logger.debug("Releasing database connection")
+        release_db_connection(conn)
+        logger.debug("finalize_test complete")
\ No newline at end of file
@@ -1,17 +1,82 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, Response, request, jsonify, send_from_directory, make_response
 import re
-from config import get_db_connection
-from services.llm_client import evaluate_answer
+import hashlib
+from config import get_db_connection, release_db_connection, execute_prepared
+from services.llm_client import evaluate_answer, evaluate_answers_batch
 import os
 import psycopg2
+from psycopg2.extras import execute_values
 import secrets
-import json
+import logging
 import uuid
-from datetime import datetime
-from werkzeug.utils import secure_filename
+import shutil
+import threading
+import time
+import atexit
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from utils.timeutil import utc_stamp
+from utils.ids import parse_uuid
+from utils import jsonutil
+from utils.cache import TTLCache
+from routes.questions import table_columns
+from werkzeug.security import safe_join
+from werkzeug.exceptions import NotFound
+from urllib.parse import quote
+import mimetypes
+
+logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "recordings")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# resolved once; serve_recording joins request paths onto it
+_UPLOAD_DIR_ABS = os.path.abspath(UPLOAD_DIR)
+# internal nginx location aliased to UPLOAD_DIR (e.g. "/internal_recordings/");
+# unset -> recordings are streamed by Flask
+RECORDINGS_ACCEL_PREFIX = os.getenv("RECORDINGS_ACCEL_PREFIX", "")
+if RECORDINGS_ACCEL_PREFIX and not RECORDINGS_ACCEL_PREFIX.endswith("/"):
+    RECORDINGS_ACCEL_PREFIX += "/"
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _stream_fd(stream):
+    """OS file descriptor behind an upload stream, or None if it lives in memory.
+
+    Large uploads are spooled by werkzeug into a SpooledTemporaryFile that has
+    rolled over to a real temp file; small ones stay in a BytesIO.
+    """
+    # look through SpooledTemporaryFile without forcing a rollover
+    src = getattr(stream, "_file", stream)
+    try:
+        return src.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def save_upload(file_storage, save_path):
+    """Copy an uploaded file to disk straight from its stream.
+
+    A disk-backed upload is copied in-kernel with os.sendfile(); otherwise it
+    goes through 1 MiB chunks.
+    """
+    stream = file_storage.stream
+    with open(save_path, "wb", buffering=0) as f:
+        in_fd = _stream_fd(stream) if hasattr(os, "sendfile") else None
+        if in_fd is not None:
+            offset = stream.tell()
+            end = os.fstat(in_fd).st_size
+            while offset < end:
+                sent = os.sendfile(f.fileno(), in_fd, offset, min(end - offset, 1 << 30))
+                if not sent:
+                    break
+                offset += sent
+            stream.seek(offset)
+            return
+        shutil.copyfileobj(stream, f, length=UPLOAD_CHUNK_SIZE)
+
+# mount prefix in front of the blueprint's /test routes, e.g. "/ai/v1"
+_SCRIPT_ROOT_RE = re.compile(r'^(.*?)/test(/|$)')
 
 def full_media_url(path):
     """Return an absolute URL for a media path stored in DB.
@@ -22,12 +87,10 @@ def full_media_url(path):
     Returns None for falsy `path`.
     """
     if not path:
-        print(f"full_media_url: input is falsy -> {path}")
         return None
     try:
         # already absolute
-        if path.startswith("http://") or path.startswith("https://"):
-            print(f"full_media_url: already absolute -> {path}")
+        if path.startswith(("http://", "https://")):
             return path
     except Exception:
         pass
@@ -40,7 +103,7 @@ def full_media_url(path):
     # cases where the blueprint is mounted under a prefix like '/ai/v1'.
     if not script_root:
         try:
-            m = re.search(r'^(.*?)/test(/|$)', request.path)
+            m = _SCRIPT_ROOT_RE.search(request.path)
             if m:
                 script_root = m.group(1).rstrip("/")
         except Exception:
@@ -50,10 +113,9 @@ def full_media_url(path):
     base = f"{host}{script_root}"
     if path.startswith("/"):
         resolved = f"{base}{path}"
-        print(f"full_media_url: resolved -> {resolved}")
-        return resolved
-    resolved = f"{base}/{path}"
-    print(f"full_media_url: resolved -> {resolved}")
+    else:
+        resolved = f"{base}/{path}"
+    logger.debug("full_media_url: %s -> %s", path, resolved)
     return resolved
 
 test_bp = Blueprint("test", __name__)
@@ -65,18 +127,30 @@ def serve_recording(filename):
     """Serve uploaded recordings from the backend `recordings` folder.
 
     Supports both `/recordings/<file>` and `/ai/recordings/<file>` URL shapes.
+    When RECORDINGS_ACCEL_PREFIX is set (behind nginx), only an X-Accel-Redirect
+    header is returned and nginx sends the file itself, e.g.:
+
+        location /internal_recordings/ { internal; alias /abs/path/to/recordings/; }
     """
-    folder = os.path.abspath(UPLOAD_DIR)
-    full_path = os.path.join(folder, filename)
+    logger.debug("serve_recording request -> folder=%s filename=%s", _UPLOAD_DIR_ABS, filename)
     try:
-        exists = os.path.exists(full_path)
-        print(f"serve_recording request -> folder={folder} filename={filename} exists={exists}")
-        if not exists:
-            print("serve_recording: file not found on disk:", full_path)
-            return jsonify({"error": "File not found", "path": full_path}), 404
-        return send_from_directory(folder, filename)
+        if RECORDINGS_ACCEL_PREFIX:
+            # nginx answers a missing file with its own page; keep the JSON 404
+            full_path = safe_join(_UPLOAD_DIR_ABS, filename)
+            if full_path is None or not os.path.isfile(full_path):
+                logger.info("serve_recording: file not found on disk: %s", full_path)
+                return jsonify({"error": "File not found", "path": full_path}), 404
+            resp = make_response("")
+            resp.headers["X-Accel-Redirect"] = RECORDINGS_ACCEL_PREFIX + quote(filename)
+            resp.headers["Content-Type"] = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            return resp
+        # does its own safe join and existence check
+        return send_from_directory(_UPLOAD_DIR_ABS, filename)
+    except NotFound:
+        logger.info("serve_recording: file not found on disk: %s", filename)
+        return jsonify({"error": "File not found", "path": safe_join(_UPLOAD_DIR_ABS, filename)}), 404
     except Exception as e:
-        print("🔥 serve_recording error:", e)
+        logger.warning("serve_recording error: %s", e)
         return jsonify({"error": "File not found"}), 404
 
 
@@ -94,25 +168,32 @@ def get_video_url_for_attempt():
     if not attempt_id:
         return jsonify({"error": "attempt_id or candidate_id required"}), 400
 
+    # only compare against the uuid `id` column when the value parses as one,
+    # so Postgres never sees an invalid uuid and can use the primary key
+    attempt_uuid = parse_uuid(attempt_id)
+
     conn = None
     cur = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        # Compare `id` as text to avoid invalid UUID cast when a candidate_id-style
-        # string (e.g. 'candidate_...') is provided. This prevents Postgres from
-        # throwing "invalid input syntax for type uuid" errors.
-        cur.execute(
-            "SELECT video_url FROM test_attempts WHERE id::text = %s OR candidate_id = %s LIMIT 1",
-            (attempt_id, attempt_id),
-        )
+        if attempt_uuid:
+            cur.execute(
+                "SELECT video_url FROM test_attempts WHERE id = %s OR candidate_id = %s LIMIT 1",
+                (attempt_uuid, attempt_id),
+            )
+        else:
+            cur.execute(
+                "SELECT video_url FROM test_attempts WHERE candidate_id = %s LIMIT 1",
+                (attempt_id,),
+            )
         row = cur.fetchone()
         if not row:
             return jsonify({"video_url": None}), 200
 
         video_path = row[0]
         resolved = full_media_url(video_path)
-        print(f"get_video_url: attempt_id={attempt_id} video_path={video_path} resolved={resolved}")
+        logger.debug("get_video_url: attempt_id=%s video_path=%s resolved=%s", attempt_id, video_path, resolved)
         return jsonify({"video_url": resolved}), 200
 
     except Exception as e:
@@ -125,19 +206,26 @@ def get_video_url_for_attempt():
                 cur.close()
             except Exception:
                 pass
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        release_db_connection(conn)
+
 
 
 
+_candidate_taken_ready = False
+
 
 def _ensure_candidate_taken_table(conn):
-    """Ensure the candidate_test_taken table exists."""
+    """Ensure the candidate_test_taken table exists (checked once per process)."""
+    global _candidate_taken_ready
+    if _candidate_taken_ready:
+        return
     cur = None
+    # the savepoint below needs a transaction block; the violations writers
+    # call this on autocommit connections, which get one for the DDL only
+    autocommit = conn.autocommit
     try:
+        if autocommit:
+            conn.autocommit = False
         cur = conn.cursor()
         cur.execute("""
             CREATE TABLE IF NOT EXISTS candidate_test_taken (
@@ -149,30 +237,63 @@ def _ensure_candidate_taken_table(conn):
                 taken_at TIMESTAMPTZ DEFAULT NOW()
             )
         """)
+        # Ensure columns exist on older schemas: add cid, job_id, taken_at if
+        # missing. Before the unique index, which needs job_id
+        cur.execute("ALTER TABLE candidate_test_taken ADD COLUMN IF NOT EXISTS cid VARCHAR(255)")
+        cur.execute("ALTER TABLE candidate_test_taken ADD COLUMN IF NOT EXISTS job_id VARCHAR(255)")
+        cur.execute("ALTER TABLE candidate_test_taken ADD COLUMN IF NOT EXISTS taken_at TIMESTAMPTZ DEFAULT NOW()")
         # create an index to speed up lookups
         cur.execute("""
             CREATE UNIQUE INDEX IF NOT EXISTS candidate_test_taken_unique_idx
             ON candidate_test_taken (candidate_id, job_id, question_set_id)
         """)
-        # Ensure columns exist on older schemas: add cid, job_id, taken_at if missing
+        # the lookup indexes are optional; under a savepoint, so a failure here
+        # keeps everything above
+        upgraded = True
+        cur.execute("SAVEPOINT ctt_upgrade")
         try:
-            cur.execute("ALTER TABLE candidate_test_taken ADD COLUMN IF NOT EXISTS cid VARCHAR(255)")
-            cur.execute("ALTER TABLE candidate_test_taken ADD COLUMN IF NOT EXISTS job_id VARCHAR(255)")
-            cur.execute("ALTER TABLE candidate_test_taken ADD COLUMN IF NOT EXISTS taken_at TIMESTAMPTZ DEFAULT NOW()")
-        except Exception:
-            # non-fatal: continue if ALTER fails for any reason
-            try:
-                conn.rollback()
-            except Exception:
-                pass
+            # the unique index leads with (candidate_id, job_id), which doesn't serve the
+            # candidate + question_set checks in start_test; cid lookups had no index
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ctt_cand_qs_job
+                ON candidate_test_taken (candidate_id, question_set_id, job_id)
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_ctt_cid_qs ON candidate_test_taken (cid, question_set_id)")
+        except Exception as e:
+            # non-fatal: carry on without them, and try again on the next call
+            logger.warning("candidate_test_taken lookup indexes failed: %s", e)
+            cur.execute("ROLLBACK TO SAVEPOINT ctt_upgrade")
+            upgraded = False
         conn.commit()
-    except Exception:
+        _candidate_taken_ready = upgraded
+    except Exception as e:
+        logger.warning("candidate_test_taken bootstrap failed: %s", e)
         try:
             conn.rollback()
         except Exception:
             pass
     finally:
         if cur: cur.close()
+        if autocommit and not conn.closed:
+            conn.autocommit = True
+
+
+def _mark_test_taken(cur, candidate_id, job_id, question_set_id, cid):
+    """Record the test as taken unless this candidate (or cid) already has it; one statement.
+
+    The two NOT EXISTS probes each match one index (idx_ctt_cand_qs_job,
+    idx_ctt_cid_qs); ON CONFLICT covers a concurrent insert hitting the unique
+    (candidate_id, job_id, question_set_id) index. Returns True when a row was added.
+    """
+    execute_prepared(cur, "mark_test_taken", """
+        INSERT INTO candidate_test_taken (candidate_id, job_id, question_set_id, cid)
+        SELECT $1::varchar, $2::varchar, $3::varchar, $4::varchar
+        WHERE NOT EXISTS (SELECT 1 FROM candidate_test_taken WHERE candidate_id = $1 AND question_set_id = $3)
+          AND NOT EXISTS (SELECT 1 FROM candidate_test_taken WHERE cid = $4 AND question_set_id = $3)
+        ON CONFLICT DO NOTHING
+        RETURNING id
+    """, (candidate_id, job_id, question_set_id, cid))
+    return cur.fetchone() is not None
 
 
 @test_bp.route("/test/taken", methods=["GET"])
@@ -192,10 +313,9 @@ def taken_tests():
             return jsonify({'error': 'candidate_id (or cid) required'}), 400
 
         cur = conn.cursor()
-        cur.execute(
-            "SELECT job_id, question_set_id, cid, taken_at FROM candidate_test_taken WHERE candidate_id = %s OR cid = %s",
-            (candidate_id, candidate_id)
-        )
+        execute_prepared(cur, "taken_by_candidate",
+                         "SELECT job_id, question_set_id, cid, taken_at FROM candidate_test_taken WHERE candidate_id = $1 OR cid = $1",
+                         (candidate_id,))
         rows = cur.fetchall()
         taken = []
         for r in rows:
@@ -212,33 +332,75 @@ def taken_tests():
         return jsonify({'error': str(e)}), 500
     finally:
         if cur: cur.close()
-        if conn: conn.close()
+        release_db_connection(conn)
 # ==============================================
 # Start Test
 # ==============================================
+# fields copied into each start_test question from the stored row / its content
+START_TOP_KEYS = ("skill", "difficulty", "time_limit", "positive_marking", "negative_marking")
+START_INNER_KEYS = ("question", "options", "correct_answer", "prompt_text", "media_url",
+                    "rubric", "suggested_time_seconds")
+# jsonb_build_object arguments for those keys, read from a question's content (c.doc)
+START_FIELDS_SQL = ", ".join(
+    [f"'{k}', c.doc->'{k}'" for k in START_TOP_KEYS]
+    + [f"'{k}', c.doc->'content'->'{k}'" for k in START_INNER_KEYS]
+)
+
+# question_set_id -> (encoded start_test body, its ETag). Sets don't change
+# during a test window; save_generated_questions evicts the entry when it adds
+# to one (in this worker; others catch up after the TTL)
+_start_payload_cache = TTLCache(ttl=int(os.getenv("START_PAYLOAD_CACHE_TTL", "300")), maxsize=256)
+
+
+def _body_etag(body):
+    """ETag for an encoded body; encoding is deterministic, so every worker agrees."""
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def _cache_headers(resp, etag, max_age=None):
+    """Tag `resp` as privately cacheable: revalidated on every use, or after `max_age` seconds."""
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    if max_age is None:
+        resp.cache_control.no_cache = True
+    else:
+        resp.cache_control.max_age = max_age
+        resp.cache_control.must_revalidate = True
+    return resp
+
+
+def _revalidated(resp, etag, max_age=None):
+    """_cache_headers(), then an empty 304 when the client's copy matches."""
+    return _cache_headers(resp, etag, max_age).make_conditional(request)
+
+
 @test_bp.route("/test/start/<question_set_id>", methods=["GET"])
 def start_test(question_set_id):
+    # the canonical form, which save_questions also evicts by
+    cache_key = parse_uuid(question_set_id)
+    if not cache_key:
+        return jsonify({"error": "question_set_id must be a UUID"}), 400
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
         # If candidate_id provided, ensure candidate hasn't already taken this test
         candidate_id = request.args.get("candidate_id") or request.args.get("cid")
         job_id = request.args.get("job_id") or request.args.get("jobId")
+        cached = _start_payload_cache.get(cache_key)
+        if candidate_id or cached is None:
+            conn = get_db_connection()
         if candidate_id:
             try:
                 _ensure_candidate_taken_table(conn)
                 chk_cur = conn.cursor()
                 if job_id:
-                    chk_cur.execute(
-                        "SELECT 1 FROM candidate_test_taken WHERE candidate_id = %s AND question_set_id = %s AND job_id = %s LIMIT 1",
-                        (candidate_id, question_set_id, job_id)
-                    )
+                    execute_prepared(chk_cur, "taken_check_job",
+                                     "SELECT 1 FROM candidate_test_taken WHERE candidate_id = $1 AND question_set_id = $2 AND job_id = $3 LIMIT 1",
+                                     (candidate_id, question_set_id, job_id))
                 else:
-                    chk_cur.execute(
-                        "SELECT 1 FROM candidate_test_taken WHERE candidate_id = %s AND question_set_id = %s LIMIT 1",
-                        (candidate_id, question_set_id)
-                    )
+                    execute_prepared(chk_cur, "taken_check",
+                                     "SELECT 1 FROM candidate_test_taken WHERE candidate_id = $1 AND question_set_id = $2 LIMIT 1",
+                                     (candidate_id, question_set_id))
                 row = chk_cur.fetchone()
                 chk_cur.close()
                 if row:
@@ -248,53 +410,40 @@ def start_test(question_set_id):
                     conn.rollback()
                 except Exception:
                     pass
+        # the taken check above stays live; only the question payload is cached
+        if cached is not None:
+            body, etag = cached
+            return _revalidated(Response(body, mimetype="application/json"), etag)
+
         cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT id, content
-            FROM questions
-            WHERE question_set_id = %s
+        # Postgres pulls the fields out of each question's content and encodes
+        # the whole payload, so no question JSON is decoded in Python
+        execute_prepared(cursor, "start_test_payload", f"""
+            SELECT count(q.id), jsonb_build_object(
+                'question_set_id', $1::text,
+                'questions', COALESCE(jsonb_agg(jsonb_build_object(
+                    'id', q.id::text, 'question_id', q.id::text,
+                    'type', COALESCE(NULLIF(NULLIF(c.doc->'type', 'null'), '""'), c.doc->'content'->'type'),
+                    {START_FIELDS_SQL}
+                )) FILTER (WHERE q.id IS NOT NULL), '[]')
+            )::text
+            FROM (SELECT 1) one
+            LEFT JOIN questions q ON q.question_set_id = $1::uuid
+            -- content saved as a JSON-encoded string decodes to the object itself
+            LEFT JOIN LATERAL (
+                SELECT CASE WHEN jsonb_typeof(q.content) = 'string'
+                            THEN (q.content #>> '{{}}')::jsonb ELSE q.content END AS doc
+            ) c ON true
         """, (question_set_id,))
-        rows = cursor.fetchall()
-
-        questions_list = []
+        count, payload = cursor.fetchone()
+        body = payload.encode()
 
-        for qid, raw in rows:
-            # qid may be UUID object
-            qid_str = str(qid)
-            raw_json = json.loads(raw) if isinstance(raw, str) else raw
-
-            question_type = (
-                raw_json.get("type")
-                or raw_json.get("content", {}).get("type")
-            )
-
-            inner = raw_json.get("content", {})
-
-            question_type = raw_json.get("type") or raw_json.get("content", {}).get("type")
-
-            questions_list.append({
-                "id": qid_str,
-                "question_id": qid_str,
-                "type": question_type,
-                "skill": raw_json.get("skill"),
-                "difficulty": raw_json.get("difficulty"),
-                "time_limit": raw_json.get("time_limit"),
-                "positive_marking": raw_json.get("positive_marking"),
-                "negative_marking": raw_json.get("negative_marking"),
-                "question": inner.get("question"),
-                "options": inner.get("options"),
-                "correct_answer": inner.get("correct_answer"),
-                "prompt_text": inner.get("prompt_text"),
-                "media_url": inner.get("media_url"),
-                "rubric": inner.get("rubric"),
-                "suggested_time_seconds": inner.get("suggested_time_seconds"),
-            })
-
-        return jsonify({
-            "question_set_id": question_set_id,
-            "questions": questions_list
-        }), 200
+        etag = _body_etag(body)
+        # an empty set may just not be saved yet
+        if count:
+            _start_payload_cache.set(cache_key, (body, etag))
+        return _revalidated(Response(body, mimetype="application/json"), etag)
 
     except Exception as e:
         print("🔥 start_test error:", e)
@@ -302,63 +451,185 @@ def start_test(question_set_id):
 
     finally:
         if cursor: cursor.close()
-        if conn: conn.close()
+        release_db_connection(conn)
 
 # ==============================================
 # List Attempts (for reports)
 # ==============================================
+ATTEMPT_COLUMNS = """id, candidate_id, question_set_id, results_data, qa_data,
+    audio_url, video_url, tab_switches, inactivities, face_not_visible, cid, created_at"""
+
+# attempt JSON key -> SQL expression over ATTEMPT_COLUMNS
+ATTEMPT_FIELDS = {
+    "audio_url": "audio_url", "candidate_id": "candidate_id", "cid": "cid", "created_at": "created_at",
+    "face_not_visible": "face_not_visible", "id": "id::text", "inactivities": "inactivities",
+    "qa_data": "qa_data", "question_set_id": "question_set_id::text", "results_data": "results_data",
+    "tab_switches": "tab_switches", "video_url": "video_url",
+}
+
+
+def _attempt_json(fields=None):
+    """One attempt as a JSON object, assembled by Postgres.
+
+    `fields` limits the keys to those ATTEMPT_FIELDS entries (default: all).
+    """
+    keys = fields or ATTEMPT_FIELDS
+    return "jsonb_build_object({})".format(", ".join(f"'{k}', {ATTEMPT_FIELDS[k]}" for k in keys))
+
+
+def _requested_fields():
+    """The ?fields=a,b projection of the attempt listings, as valid ATTEMPT_FIELDS keys.
+
+    Returns None when the parameter is absent (all fields); raises ValueError
+    naming any unknown field.
+    """
+    raw = request.args.get("fields")
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in ATTEMPT_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    # keep the usual key order; drop repeats
+    return [k for k in ATTEMPT_FIELDS if k in fields] or None
+
+
+def _has_attempt_sections(cur):
+    """Whether submitted sections go to test_attempt_sections (migration 008)."""
+    return "results_data" in table_columns(cur, "test_attempt_sections")
+
+
+def _attempt_select(cur, results=True):
+    """SELECT ... FROM test_attempts yielding ATTEMPT_COLUMNS.
+
+    With migration 008, results_data is the legacy column followed by the
+    entries of the attempt's section rows, in submission order; pass
+    results=False to skip gathering those when results_data isn't wanted.
+    """
+    if not results or not _has_attempt_sections(cur):
+        return f"SELECT {ATTEMPT_COLUMNS} FROM test_attempts"
+    return f"""SELECT {ATTEMPT_COLUMNS.replace(
+            "results_data,",
+            "CASE WHEN sec.items IS NULL THEN results_data"
+            " ELSE COALESCE(results_data, '[]'::jsonb) || sec.items END AS results_data,")}
+        FROM test_attempts
+        LEFT JOIN LATERAL (
+            SELECT jsonb_agg(e.item ORDER BY s.id, e.ord) AS items
+            FROM test_attempt_sections s
+            CROSS JOIN LATERAL jsonb_array_elements(s.results_data) WITH ORDINALITY AS e(item, ord)
+            WHERE s.attempt_id = test_attempts.id
+        ) sec ON true"""
+
+
+def _attempts_json(cur, where, params, order, limit, fields=None):
+    """(row count, JSON array text) of the attempts matching `where`, built in one query.
+
+    The document comes back as text and is sent as-is, so rows are never
+    decoded into Python objects and re-encoded. `fields` limits the keys of
+    each attempt (see _requested_fields).
+    """
+    select = _attempt_select(cur, results=not fields or "results_data" in fields)
+    cur.execute(f"""
+        SELECT count(*), COALESCE(jsonb_agg({_attempt_json(fields)} ORDER BY {order}), '[]')::text
+        FROM ({select} {where} ORDER BY {order} LIMIT {int(limit)}) a
+    """, params)
+    return cur.fetchone()
+
+
+def _raw_json(body, status=200):
+    return Response(body, status=status, mimetype="application/json")
+
+
+# how long a dashboard may reuse the attempts listing before revalidating
+ATTEMPTS_MAX_AGE = 5
+
+
+def _attempts_etag(cur, fields):
+    """Validator for the list_attempts document, without reading its JSON columns.
+
+    Every write to an attempt gives its row a new xmin, so hashing (id, xmin)
+    of the listed rows -- plus the newest section row (migration 008) --
+    changes whenever the document would.
+    """
+    sections = "(SELECT max(id) FROM test_attempt_sections)" if _has_attempt_sections(cur) else "NULL"
+    cur.execute(f"""
+        SELECT md5(string_agg(id::text || ':' || xmin::text, ',' ORDER BY created_at DESC NULLS LAST, id)),
+               {sections}
+        FROM (SELECT id, xmin, created_at FROM test_attempts ORDER BY created_at DESC NULLS LAST LIMIT 1000) a
+    """)
+    rows_hash, last_section = cur.fetchone()
+    return _body_etag(f"{rows_hash}|{last_section}|{fields}".encode())
+
+
+# rows pulled per round-trip by the streaming listing, and bytes buffered per write
+ATTEMPT_STREAM_ROWS = 200
+ATTEMPT_FLUSH_BYTES = 64 * 1024
+
+
 @test_bp.route("/test/attempts", methods=["GET"])
 def list_attempts():
+    """Stream the latest 1000 attempts as {"attempts": [...]}.
+
+    Rows come off a server-side cursor, already encoded by Postgres, and are
+    written out as they arrive, so neither the rows nor the whole document are
+    held in memory. The connection is returned once the response is closed.
+    ?fields=id,candidate_id,... limits the keys of each attempt.
+    """
+    try:
+        fields = _requested_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     conn = None
     cur = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, candidate_id, question_set_id, results_data, qa_data,
-                   audio_url, video_url, tab_switches, inactivities, face_not_visible, cid, created_at
-            FROM test_attempts
+        with conn.cursor() as schema_cur:
+            select = _attempt_select(schema_cur, results=not fields or "results_data" in fields)
+            etag = _attempts_etag(schema_cur, fields)
+        if request.if_none_match.contains(etag):
+            release_db_connection(conn)
+            conn = None
+            return _cache_headers(Response(status=304), etag, ATTEMPTS_MAX_AGE)
+        cur = conn.cursor(name="list_attempts_stream")
+        cur.itersize = ATTEMPT_STREAM_ROWS
+        cur.execute(f"""
+            SELECT {_attempt_json(fields)}::text
+            FROM ({select} ORDER BY created_at DESC NULLS LAST LIMIT 1000) a
             ORDER BY created_at DESC NULLS LAST
-            LIMIT 1000
         """)
-        rows = cur.fetchall()
-
-        attempts = []
-        for r in rows:
-            (rid, candidate_id, question_set_id, results_data, qa_data,
-             audio_url, video_url, tab_switches, inactivities, face_not_visible, cid, created_at) = r
-
-            def _maybe_parse(v):
-                if v is None: return None
-                if isinstance(v, str):
-                    try:
-                        return json.loads(v)
-                    except Exception:
-                        return v
-                return v
-
-            attempts.append({
-                "id": str(rid) if rid is not None else None,
-                "candidate_id": candidate_id,
-                "question_set_id": str(question_set_id) if question_set_id is not None else None,
-                "results_data": _maybe_parse(results_data),
-                "qa_data": _maybe_parse(qa_data),
-                "audio_url": audio_url,
-                "video_url": video_url,
-                "tab_switches": tab_switches,
-                "inactivities": inactivities,
-                "face_not_visible": face_not_visible,
-                "cid": cid,
-                "created_at": created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at,
-            })
-
-        return jsonify({"attempts": attempts}), 200
+        first = cur.fetchone()
     except Exception as e:
         print("🔥 list_attempts error:", e)
-        return jsonify({"error": str(e)}), 500
-    finally:
         if cur: cur.close()
-        if conn: conn.close()
+        release_db_connection(conn)
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        parts, size = ['{"attempts":['], 0
+        if first is not None:
+            parts.append(first[0])
+            for (doc,) in cur:
+                parts.append(",")
+                parts.append(doc)
+                size += len(doc)
+                if size >= ATTEMPT_FLUSH_BYTES:
+                    yield "".join(parts)
+                    parts, size = [], 0
+        parts.append("]}")
+        yield "".join(parts)
+
+    def close():
+        try:
+            cur.close()
+        except Exception:
+            pass
+        release_db_connection(conn)
+
+    resp = Response(generate(), mimetype="application/json")
+    # runs even if the client goes away before the body is iterated
+    resp.call_on_close(close)
+    return _cache_headers(resp, etag, ATTEMPTS_MAX_AGE)
 
 
 @test_bp.route("/test/attempts/<attempt_id>", methods=["GET", "DELETE", "OPTIONS"])
@@ -366,6 +637,10 @@ def attempt_detail(attempt_id):
         # handle preflight
         if request.method == "OPTIONS":
             return ('', 204)
+        try:
+            fields = _requested_fields()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         conn = None
         cur = None
@@ -374,127 +649,304 @@ def attempt_detail(attempt_id):
             cur = conn.cursor()
 
             if request.method == 'DELETE':
-                cur.execute(
-                    """
-                    DELETE FROM test_attempts
-                    WHERE id = %s OR candidate_id = %s
-                    RETURNING id
-                    """,
-                    (attempt_id, attempt_id)
-                )
+                attempt_uuid = parse_uuid(attempt_id)
+                if attempt_uuid:
+                    cur.execute(
+                        """
+                        DELETE FROM test_attempts
+                        WHERE id = %s OR candidate_id = %s
+                        RETURNING id
+                        """,
+                        (attempt_uuid, attempt_id)
+                    )
+                else:
+                    cur.execute(
+                        "DELETE FROM test_attempts WHERE candidate_id = %s RETURNING id",
+                        (attempt_id,)
+                    )
                 row = cur.fetchone()
                 if not row:
                     return jsonify({"error": "Attempt not found"}), 404
                 conn.commit()
                 return jsonify({"deleted": True, "id": str(row[0])}), 200
 
-            # GET: try treating the path param as a question_set_id and return
-            # all attempts for that question_set. If none are found, fall back
-            # to fetching a single attempt by id or candidate_id (existing behavior).
-            cur.execute("""
-                SELECT id, candidate_id, question_set_id, results_data, qa_data,
-                       audio_url, video_url, tab_switches, inactivities, face_not_visible, cid, created_at
-                FROM test_attempts
-                WHERE question_set_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1000
-            """, (attempt_id,))
-
-            rows = cur.fetchall()
-            if not rows:
-                return jsonify({"message": "No data for this test"}), 200
-            if rows:
-                attempts = []
-                for r in rows:
-                    (rid, candidate_id, question_set_id, results_data, qa_data,
-                     audio_url, video_url, tab_switches, inactivities, face_not_visible, cid, created_at) = r
-
-                    def _maybe_parse(v):
-                        if v is None: return None
-                        if isinstance(v, str):
-                            try:
-                                return json.loads(v)
-                            except Exception:
-                                return v
-                        return v
-
-                    attempts.append({
-                        "id": str(rid) if rid is not None else None,
-                        "candidate_id": candidate_id,
-                        "question_set_id": str(question_set_id) if question_set_id is not None else None,
-                        "results_data": _maybe_parse(results_data),
-                        "qa_data": _maybe_parse(qa_data),
-                        "audio_url": audio_url,
-                        "video_url": video_url,
-                        "tab_switches": tab_switches,
-                        "inactivities": inactivities,
-                        "face_not_visible": face_not_visible,
-                        "cid": cid,
-                        "created_at": created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at,
-                    })
-
-                return jsonify(attempts), 200
-
-            # GET fallback: fetch single attempt by id or candidate_id
-            cur.execute("""
-                SELECT id, candidate_id, question_set_id, results_data, qa_data,
-                       audio_url, video_url, tab_switches, inactivities, face_not_visible, cid, created_at
-                FROM test_attempts
-                WHERE id = %s OR candidate_id = %s
-                LIMIT 1
-            """, (attempt_id, attempt_id))
+            # GET: a UUID is tried as a question_set_id first (all attempts of that
+            # set), then as an attempt id; anything else can only be a candidate_id,
+            # so it goes straight to that lookup
+            attempt_uuid = parse_uuid(attempt_id)
+            if attempt_uuid:
+                count, attempts = _attempts_json(
+                    cur, "WHERE question_set_id = %s", (attempt_id,), "created_at DESC", 1000, fields
+                )
+                if count:
+                    return _raw_json(attempts)
+
+            # single attempt: each branch has its own index (primary key /
+            # candidate_id), which an `id = %s OR candidate_id = %s` filter can't use
+            select = _attempt_select(cur, results=not fields or "results_data" in fields)
+            attempt_json = _attempt_json(fields)
+            if attempt_uuid:
+                cur.execute(f"""
+                    SELECT {attempt_json}::text FROM (
+                        ({select} WHERE id = %s LIMIT 1)
+                        UNION ALL
+                        ({select} WHERE candidate_id = %s LIMIT 1)
+                    ) a LIMIT 1
+                """, (attempt_uuid, attempt_id))
+            else:
+                cur.execute(f"""
+                    SELECT {attempt_json}::text
+                    FROM ({select} WHERE candidate_id = %s LIMIT 1) a
+                """, (attempt_id,))
 
             row = cur.fetchone()
             if not row:
-                return jsonify({"error": "Attempt not found"}), 404
-
-            (rid, candidate_id, question_set_id, results_data, qa_data,
-             audio_url, video_url, tab_switches, inactivities, face_not_visible, cid, created_at) = row
-
-            def _maybe_parse(v):
-                if v is None: return None
-                if isinstance(v, str):
-                    try:
-                        return json.loads(v)
-                    except Exception:
-                        return v
-                return v
-
-            attempt = {
-                "id": str(rid) if rid is not None else None,
-                "candidate_id": candidate_id,
-                "question_set_id": str(question_set_id) if question_set_id is not None else None,
-                "results_data": _maybe_parse(results_data),
-                "qa_data": _maybe_parse(qa_data),
-                "audio_url": audio_url,
-                "video_url": video_url,
-                "tab_switches": tab_switches,
-                "inactivities": inactivities,
-                "face_not_visible": face_not_visible,
-                "cid": cid,
-                "created_at": created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at,
-            }
+                return jsonify({"message": "No data for this test"}), 200
 
-            return jsonify(attempt), 200
+            return _raw_json(row[0])
 
         except Exception as e:
             print("🔥 attempt_detail error:", e)
             return jsonify({"error": str(e)}), 500
         finally:
             if cur: cur.close()
-            if conn: conn.close()
+            release_db_connection(conn)
+
+_attempts_keyed = None
+
+
+def attempts_keyed(cur):
+    """Whether test_attempts has the unique (candidate_id, question_set_id) index (migration 009)."""
+    global _attempts_keyed
+    if _attempts_keyed is None:
+        cur.execute("SELECT to_regclass('uq_ta_cand_qs') IS NOT NULL")
+        _attempts_keyed = cur.fetchone()[0]
+    return _attempts_keyed
+
+
+def _upsert_attempt(cur, candidate_id, question_set_id, updates, inserts, cid=None):
+    """Update the attempt row for (candidate_id, question_set_id), or insert it, in one statement.
+
+    `updates` is a list of (SET fragment, param) pairs, `inserts` a list of
+    (column, value) pairs used when no row exists yet; `cid` is merged in when
+    the table has that column. With the unique index from migration 009 this
+    is INSERT ... ON CONFLICT DO UPDATE; before it, the UPDATE runs as a
+    writable CTE and the INSERT only fires when it matched nothing.
+
+    Each distinct shape of the statement is PREPAREd once per connection.
+    Returns the attempt id.
+    """
+    if "cid" in table_columns(cur, "test_attempts"):
+        updates = updates + [("cid = COALESCE(%s, test_attempts.cid)", cid)]
+        inserts = inserts + [("cid", cid)]
+    cols = ["candidate_id", "question_set_id"] + [col for col, _ in inserts]
+    values = [candidate_id, question_set_id] + [val for _, val in inserts]
+    if attempts_keyed(cur):
+        n = len(cols)
+        set_sql = ", ".join(frag.replace("%s", f"${i}") for i, (frag, _) in enumerate(updates, n + 1))
+        sql = f"""
+            INSERT INTO test_attempts ({", ".join(cols)})
+            VALUES ({", ".join(f"${i}" for i in range(1, n + 1))})
+            ON CONFLICT (candidate_id, question_set_id) DO UPDATE SET {set_sql}
+            RETURNING id
+        """
+        params = values + [param for _, param in updates]
+    else:
+        n = len(updates)
+        set_sql = ", ".join(frag.replace("%s", f"${i}") for i, (frag, _) in enumerate(updates, 1))
+        sql = f"""
+            WITH upd AS (
+                UPDATE test_attempts
+                SET {set_sql}
+                WHERE candidate_id = ${n + 1} AND question_set_id = ${n + 2}
+                RETURNING id
+            ), ins AS (
+                INSERT INTO test_attempts ({", ".join(cols)})
+                SELECT {", ".join(f"${i}" for i in range(n + 3, n + 3 + len(cols)))}
+                WHERE NOT EXISTS (SELECT 1 FROM upd)
+                RETURNING id
+            )
+            SELECT id FROM upd UNION ALL SELECT id FROM ins
+        """
+        params = [param for _, param in updates] + [candidate_id, question_set_id] + values
+    name = "upsert_attempt_" + hashlib.sha1(sql.encode()).hexdigest()[:12]
+    execute_prepared(cur, name, sql, params)
+    row = cur.fetchone()
+    return row[0] if row else None
+
 
 # ==============================================
 # Save Violations
 # ==============================================
+# violation counters are absolute values that clients resend often; with a
+# window set, each worker keeps only the latest per attempt and writes them
+# all in one statement every VIOLATIONS_FLUSH_MS (0 = write per request).
+# Resends land on different workers, each flushing on its own timer, so an
+# older total can arrive after a newer one; counters only ever grow, and every
+# write keeps the larger of the stored and the new value.
+# A batch that can't reach the database is requeued; a worker killed outright
+# (SIGKILL, OOM) loses at most one window's updates, which the client's next
+# call (carrying the totals again) replaces
+VIOLATIONS_FLUSH_MS = int(os.getenv("VIOLATIONS_FLUSH_MS", "500"))
+_COUNTER_MAX = 2 ** 31 - 1  # integer columns
+_VIOLATION_COUNTERS = ("tab_switches", "inactivities", "face_not_visible")
+
+# (candidate_id, question_set_id) -> latest (tab_switches, inactivities, face_not_visible, cid, job_id)
+_pending_violations = {}
+_pending_violations_lock = threading.Lock()
+_violations_flusher = None
+
+
+def _mark_taken_logged(conn, cur, candidate_id, job_id, question_set_id, cid):
+    """_mark_test_taken() for save_violations; failures are logged, never raised."""
+    try:
+        _ensure_candidate_taken_table(conn)
+        if _mark_test_taken(cur, candidate_id, job_id, question_set_id, cid):
+            logger.debug("Inserted candidate_test_taken: candidate_id=%s job_id=%s question_set_id=%s cid=%s",
+                         candidate_id, job_id, question_set_id, cid)
+        else:
+            logger.debug("candidate_test_taken entry already exists for %s/%s; no insert performed",
+                         candidate_id, question_set_id)
+    except Exception as ex_ins:
+        logger.warning("Error while inserting into candidate_test_taken: %s", ex_ins)
+
+
+def _merge_violations(old, new):
+    """Two queued values for one attempt: the larger counters, and new's cid/job_id unless missing."""
+    return (*(max(a, b) for a, b in zip(old[:3], new[:3])), new[3] or old[3], new[4] or old[4])
+
+
+def _violation_updates(tab, inact, face):
+    """_upsert_attempt() SET fragments that never lower a stored counter."""
+    return [(f"{col} = GREATEST(test_attempts.{col}, %s)", val)
+            for col, val in zip(_VIOLATION_COUNTERS, (tab, inact, face))]
+
+
+def _queue_violations(candidate_id, question_set_id, tab_switches, inactivities, face_not_visible, cid, job_id):
+    """Hold the highest counters seen for an attempt until the next flush."""
+    global _violations_flusher
+    key = (candidate_id, question_set_id)
+    with _pending_violations_lock:
+        value = (tab_switches, inactivities, face_not_visible, cid, job_id)
+        prev = _pending_violations.get(key)
+        _pending_violations[key] = _merge_violations(prev, value) if prev else value
+        if _violations_flusher is None:
+            # started on first use, so it runs in the worker process, not a pre-fork master
+            _violations_flusher = threading.Thread(target=_violations_flush_loop, name="violations-flush", daemon=True)
+            _violations_flusher.start()
+            atexit.register(_flush_violations)
+
+
+def _violations_flush_loop():
+    while True:
+        time.sleep(VIOLATIONS_FLUSH_MS / 1000)
+        try:
+            _flush_violations()
+        except Exception:
+            logger.exception("violations flush failed")
+
+
+def _requeue_violations(batch):
+    """Put an unwritten batch back, merged with anything queued for the same attempt since."""
+    with _pending_violations_lock:
+        for key, value in batch.items():
+            newer = _pending_violations.get(key)
+            _pending_violations[key] = _merge_violations(value, newer) if newer else value
+
+
+def _violations_upsert_sql(with_cid):
+    """INSERT ... ON CONFLICT for keyed test_attempts; the VALUES go where %s is."""
+    cols = "candidate_id, question_set_id, tab_switches, inactivities, face_not_visible"
+    sets = ", ".join(f"{col} = GREATEST(test_attempts.{col}, EXCLUDED.{col})" for col in _VIOLATION_COUNTERS)
+    if with_cid:
+        cols += ", cid"
+        sets += ", cid = COALESCE(EXCLUDED.cid, test_attempts.cid)"
+    return f"""
+        INSERT INTO test_attempts ({cols}) VALUES %s
+        ON CONFLICT (candidate_id, question_set_id) DO UPDATE SET {sets}
+    """
+
+
+def _write_violations_row(cur, keyed, with_cid, cand, qs, tab, inact, face, cid):
+    if keyed:
+        params = (cand, qs, tab, inact, face, cid) if with_cid else (cand, qs, tab, inact, face)
+        cur.execute(_violations_upsert_sql(with_cid) % ("(" + ", ".join(["%s"] * len(params)) + ")"), params)
+    else:
+        _upsert_attempt(cur, cand, qs, _violation_updates(tab, inact, face),
+                        list(zip(_VIOLATION_COUNTERS, (tab, inact, face))), cid)
+
+
+def _flush_violations():
+    """Write every queued attempt's counters, then mark those tests taken.
+
+    One statement for the whole batch when test_attempts is keyed; if that
+    fails, rows are retried one by one so a bad row only loses itself. When the
+    database can't be reached, the unwritten rows are requeued.
+    """
+    global _pending_violations
+    with _pending_violations_lock:
+        batch, _pending_violations = _pending_violations, {}
+    if not batch:
+        return
+    conn = None
+    cur = None
+    written = {}
+    try:
+        conn = get_db_connection()
+        conn.autocommit = True
+        cur = conn.cursor()
+        with_cid = "cid" in table_columns(cur, "test_attempts")
+        keyed = attempts_keyed(cur)
+        if keyed:
+            rows = []
+            for (cand, qs), (tab, inact, face, cid, _) in batch.items():
+                rows.append((cand, qs, tab, inact, face, cid) if with_cid else (cand, qs, tab, inact, face))
+            try:
+                execute_values(cur, _violations_upsert_sql(with_cid), rows, page_size=len(rows))
+                written = batch
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                raise
+            except psycopg2.Error as e:
+                logger.warning("save_violations: batch of %d failed (%s); writing rows one by one", len(batch), e)
+        if not written:
+            for key, (tab, inact, face, cid, job_id) in batch.items():
+                try:
+                    _write_violations_row(cur, keyed, with_cid, *key, tab, inact, face, cid)
+                    written[key] = (tab, inact, face, cid, job_id)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    raise
+                except psycopg2.Error as e:
+                    # nothing to retry: the row itself is bad
+                    logger.error("save_violations: dropping counters for %s/%s: %s", key[0], key[1], e)
+                    written[key] = None
+        logger.debug("save_violations: flushed counters for %d attempts", len(written))
+        for (cand, qs), value in written.items():
+            if value is not None:
+                _mark_taken_logged(conn, cur, cand, value[4], qs, value[3])
+    except Exception:
+        _requeue_violations({k: v for k, v in batch.items() if k not in written})
+        raise
+    finally:
+        if cur: cur.close()
+        release_db_connection(conn)
+
+
+def _violation_count(value):
+    """An integer counter from the request body, None if absent; ValueError if it isn't one."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    count = int(value)
+    if not 0 <= count <= _COUNTER_MAX:
+        raise ValueError(value)
+    return count
+
+
 @test_bp.route("/test/save_violations", methods=["POST"])
 def save_violations():
     data = request.get_json() or {}
-    print("save_violations called")
-    try:
-        print("Request JSON:", data)
-    except Exception:
-        print("Request JSON (non-serializable):", data)
+    logger.debug("save_violations request: %s", data)
     candidate_id = data.get("candidate_id")
     question_set_id = data.get("question_set_id")
     tab_switches = data.get("tab_switches", 0)
@@ -502,126 +954,51 @@ def save_violations():
     face_not_visible = data.get("face_not_visible", 0)
     cid = data.get("cid")
 
-    print(f"Parsed: candidate_id={candidate_id} question_set_id={question_set_id} tab_switches={tab_switches} inactivities={inactivities} face_not_visible={face_not_visible} cid={cid}")
+    logger.debug("save_violations parsed: candidate_id=%s question_set_id=%s tab_switches=%s inactivities=%s face_not_visible=%s cid=%s",
+                 candidate_id, question_set_id, tab_switches, inactivities, face_not_visible, cid)
 
     if not candidate_id or not question_set_id:
         return jsonify({"error": "candidate_id and question_set_id required"}), 400
+    # one spelling per attempt, and nothing queued that the flush can't write
+    question_set_id = parse_uuid(question_set_id)
+    if question_set_id is None:
+        return jsonify({"error": "question_set_id must be a UUID"}), 400
+    candidate_id = str(candidate_id).strip()
+    try:
+        tab_switches = _violation_count(tab_switches)
+        inactivities = _violation_count(inactivities)
+        face_not_visible = _violation_count(face_not_visible)
+    except (TypeError, ValueError):
+        return jsonify({"error": "tab_switches, inactivities and face_not_visible must be non-negative integers"}), 400
+    cid = str(cid) if cid is not None else None
 
     conn = None
     cur = None
     try:
+        job_id = data.get("job_id") or data.get("jobId")
+        if VIOLATIONS_FLUSH_MS > 0:
+            _queue_violations(candidate_id, question_set_id, tab_switches, inactivities,
+                              face_not_visible, cid, job_id)
+            return jsonify({"message": "Violations updated"}), 202
+
         conn = get_db_connection()
+        # single statement: let it commit on its own instead of BEGIN/COMMIT round-trips
+        conn.autocommit = True
         cur = conn.cursor()
 
-        # Try updating an existing attempt row first; if none updated, insert a new row.
-        try:
-            cur.execute("""
-                UPDATE test_attempts
-                SET tab_switches = %s,
-                    inactivities = %s,
-                    face_not_visible = %s,
-                    cid = COALESCE(%s, cid)
-                WHERE candidate_id = %s AND question_set_id = %s
-            """, (
-                tab_switches,
-                inactivities,
-                face_not_visible,
-                cid,
-                candidate_id,
-                question_set_id
-            ))
-
-            if cur.rowcount == 0:
-                cur.execute("""
-                    INSERT INTO test_attempts (
-                        candidate_id, question_set_id,
-                        tab_switches, inactivities, face_not_visible, cid
-                    ) VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
-                    candidate_id,
-                    question_set_id,
-                    tab_switches,
-                    inactivities,
-                    face_not_visible,
-                    cid
-                ))
-        except Exception as e:
-            msg = str(e).lower()
-            if 'column "cid" does not exist' in msg or 'cid' in msg and 'does not exist' in msg:
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-                cur.execute("""
-                    UPDATE test_attempts
-                    SET tab_switches = %s,
-                        inactivities = %s,
-                        face_not_visible = %s
-                    WHERE candidate_id = %s AND question_set_id = %s
-                """, (
-                    tab_switches,
-                    inactivities,
-                    face_not_visible,
-                    candidate_id,
-                    question_set_id
-                ))
-
-                if cur.rowcount == 0:
-                    cur.execute("""
-                        INSERT INTO test_attempts (
-                            candidate_id, question_set_id,
-                            tab_switches, inactivities, face_not_visible, cid
-                        ) VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (
-                        candidate_id,
-                        question_set_id,
-                        tab_switches,
-                        inactivities,
-                        face_not_visible,
-                        cid
-                    ))
-            else:
-                raise
+        updates = _violation_updates(tab_switches, inactivities, face_not_visible)
+        inserts = [
+            ("tab_switches", tab_switches),
+            ("inactivities", inactivities),
+            ("face_not_visible", face_not_visible),
+        ]
+        _upsert_attempt(cur, candidate_id, question_set_id, updates, inserts, cid)
 
-        conn.commit()
-        try:
-            print("test_attempts updated/inserted; committed. Current tab_switches:", tab_switches)
-        except Exception:
-            pass
+        logger.debug("save_violations: test_attempts upserted, tab_switches=%s", tab_switches)
         # Mark test as completed so candidate cannot retake.
-        # Insert into candidate_test_taken unconditionally (based on this violations call),
-        # avoiding duplicates by checking existence first.
-        try:
-            try:
-                _ensure_candidate_taken_table(conn)
-                ins_cur = conn.cursor()
-                job_id = data.get("job_id") or data.get("jobId")
-                ins_cur.execute(
-                    "SELECT 1 FROM candidate_test_taken WHERE (candidate_id = %s OR cid = %s) AND question_set_id = %s LIMIT 1",
-                    (candidate_id, cid, question_set_id)
-                )
-                exists = ins_cur.fetchone()
-                if not exists:
-                    ins_cur.execute(
-                        "INSERT INTO candidate_test_taken (candidate_id, job_id, question_set_id, cid) VALUES (%s, %s, %s, %s)",
-                        (candidate_id, job_id, question_set_id, cid)
-                    )
-                    conn.commit()
-                    print(f"Inserted candidate_test_taken: candidate_id={candidate_id} job_id={job_id} question_set_id={question_set_id} cid={cid}")
-                else:
-                    print("candidate_test_taken entry already exists for candidate/question_set; no insert performed.")
-                try:
-                    ins_cur.close()
-                except Exception:
-                    pass
-            except Exception as ex_ins:
-                print("Error while inserting into candidate_test_taken:", ex_ins)
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        # Insert into candidate_test_taken unconditionally (based on this violations call);
+        # _mark_test_taken skips it when the candidate already has an entry.
+        _mark_taken_logged(conn, cur, candidate_id, job_id, question_set_id, cid)
 
         return jsonify({"message": "Violations updated"}), 200
 
@@ -631,15 +1008,90 @@ def save_violations():
 
     finally:
         if cur: cur.close()
-        if conn: conn.close()
+        release_db_connection(conn)
 
 # ==============================================
 # Upload Audio
 # ==============================================
-@test_bp.route("/upload_audio", methods=["POST"])
-def upload_audio():
+# anything outside this set becomes "_", so names never carry a path separator
+_FILENAME_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+_FILENAME_MAX = 120
+
+
+def _safe_filename(name):
+    """Replacement for secure_filename() on our own <candidate>_<stamp>... names.
+
+    One precompiled substitution; the name is capped at _FILENAME_MAX characters,
+    trimmed from the stem so the extension survives.
+    """
+    root, ext = os.path.splitext(_FILENAME_UNSAFE.sub("_", name))
+    ext = ext[:16]
+    return root.lstrip(".")[:_FILENAME_MAX - len(ext)] + ext
+
+
+# opt-in: with UPLOAD_ASYNC=1 the handlers answer 202 "accepted" once the file
+# is on disk and the attempt row is written here, off the request thread. The
+# client then has no way to learn whether the write landed, and it can race a
+# later submit_section for the same attempt, so the default writes inline
+UPLOAD_ASYNC = os.getenv("UPLOAD_ASYNC", "0") == "1"
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+_upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+def _persist_upload(candidate_id, question_set_id, updates, inserts, cid):
+    """Record an uploaded file's URL and qa_data on the attempt row."""
     conn = None
     cur = None
+    try:
+        conn = get_db_connection()
+        # single statement: let it commit on its own instead of BEGIN/COMMIT round-trips
+        conn.autocommit = True
+        cur = conn.cursor()
+        _upsert_attempt(cur, candidate_id, question_set_id, updates, inserts, cid)
+    finally:
+        if cur: cur.close()
+        release_db_connection(conn)
+
+
+def _persist_upload_logged(*args):
+    try:
+        _persist_upload(*args)
+    except Exception:
+        logger.exception("background upload persist failed for %s/%s", args[0], args[1])
+
+
+def _finish_upload(url_key, url, candidate_id, question_set_id, qa_json, cid):
+    """Write the attempt row for a saved upload (in the background when UPLOAD_ASYNC)."""
+    updates = [
+        (f"{url_key} = COALESCE(%s, test_attempts.{url_key})", url),
+        ("qa_data = COALESCE(test_attempts.qa_data, '[]'::jsonb) || %s::jsonb", qa_json),
+    ]
+    inserts = [(url_key, url), ("qa_data", qa_json)]
+    args = (candidate_id, question_set_id, updates, inserts, cid)
+    if UPLOAD_ASYNC:
+        _upload_executor.submit(_persist_upload_logged, *args)
+        return jsonify({"status": "accepted", url_key: url}), 202
+    _persist_upload(*args)
+    return jsonify({"status": "success", url_key: url}), 200
+
+
+def _qa_json(raw):
+    """The client's qa_data form field as JSON text for a `%s::jsonb` parameter.
+
+    Valid JSON is passed through as sent (Postgres parses it anyway); it is
+    only decoded here to check it, never re-encoded. Missing or invalid -> "[]".
+    """
+    if not raw:
+        return "[]"
+    try:
+        jsonutil.loads(raw)
+    except Exception:
+        return "[]"
+    return raw
+
+
+@test_bp.route("/upload_audio", methods=["POST"])
+def upload_audio():
     try:
         if "audio" not in request.files:
             return jsonify({"error": "audio file required"}), 400
@@ -650,107 +1102,27 @@ def upload_audio():
 
         candidate_id = request.form.get("candidate_id")
         question_set_id = request.form.get("question_set_id")
-        qa_raw = request.form.get("qa_data") or "[]"
+        qa_json = _qa_json(request.form.get("qa_data"))
         cid = request.form.get("cid")
 
-        try:
-            qa_data = json.loads(qa_raw)
-        except Exception:
-            qa_data = []
-
         ext = os.path.splitext(audio_file.filename)[1] or ".webm"
-        ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        safe = secure_filename(f"{candidate_id}_{ts}{ext}")
+        safe = _safe_filename(f"{candidate_id}_{utc_stamp()}{ext}")
         save_path = os.path.join(UPLOAD_DIR, safe)
-        audio_file.save(save_path)
+        save_upload(audio_file, save_path)
         audio_url = f"/{UPLOAD_DIR}/{safe}"
-        print(f"upload_audio: saved -> {save_path} audio_url={audio_url}")
-
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        # Try to update existing attempt row first; otherwise insert.
-        # If the DB doesn't have a `cid` column, fall back to SQL without it.
-        try:
-            cur.execute("""
-                UPDATE test_attempts
-                SET audio_url = COALESCE(%s, audio_url),
-                    qa_data = COALESCE(test_attempts.qa_data, '[]'::jsonb) || %s::jsonb,
-                    cid = COALESCE(%s, cid)
-                WHERE candidate_id = %s AND question_set_id = %s
-            """, (
-                audio_url,
-                json.dumps(qa_data),
-                cid,
-                candidate_id,
-                question_set_id,
-            ))
-
-            if cur.rowcount == 0:
-                cur.execute("""
-                    INSERT INTO test_attempts (
-                        candidate_id, question_set_id, audio_url, qa_data, cid
-                    ) VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    candidate_id,
-                    question_set_id,
-                    audio_url,
-                    json.dumps(qa_data),
-                    cid
-                ))
-        except Exception as e:
-            msg = str(e).lower()
-            if 'column "cid" does not exist' in msg or 'cid' in msg and 'does not exist' in msg:
-                # Rollback the failed statement and retry without cid column
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-                cur.execute("""
-                    UPDATE test_attempts
-                    SET audio_url = COALESCE(%s, audio_url),
-                        qa_data = COALESCE(test_attempts.qa_data, '[]'::jsonb) || %s::jsonb
-                    WHERE candidate_id = %s AND question_set_id = %s
-                """, (
-                    audio_url,
-                    json.dumps(qa_data),
-                    candidate_id,
-                    question_set_id,
-                ))
-
-                if cur.rowcount == 0:
-                    cur.execute("""
-                        INSERT INTO test_attempts (
-                            candidate_id, question_set_id, audio_url, qa_data
-                        ) VALUES (%s, %s, %s, %s)
-                    """, (
-                        candidate_id,
-                        question_set_id,
-                        audio_url,
-                        json.dumps(qa_data)
-                    ))
-            else:
-                raise
+        logger.debug("upload_audio: saved -> %s audio_url=%s", save_path, audio_url)
 
-        conn.commit()
-
-        return jsonify({"status": "success", "audio_url": audio_url}), 200
+        return _finish_upload("audio_url", audio_url, candidate_id, question_set_id, qa_json, cid)
 
     except Exception as e:
         print("🔥 upload_audio error:", e)
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if cur: cur.close()
-        if conn: conn.close()
-
 # ==============================================
 # Upload Video
 # ==============================================
 @test_bp.route("/upload_video", methods=["POST"])
 def upload_video():
-    conn = None
-    cur = None
     try:
         if "file" not in request.files:
             return jsonify({"error": "video file required"}), 400
@@ -761,102 +1133,247 @@ def upload_video():
 
         candidate_id = request.form.get("candidate_id")
         question_set_id = request.form.get("question_set_id")
-        qa_raw = request.form.get("qa_data") or "[]"
+        qa_json = _qa_json(request.form.get("qa_data"))
         cid = request.form.get("cid")
 
+        final_name = _safe_filename(f"{candidate_id}_{utc_stamp()}_{video_file.filename}")
+        save_path = os.path.join(UPLOAD_DIR, final_name)
+        save_upload(video_file, save_path)
+        video_url = f"/{UPLOAD_DIR}/{final_name}"
+        logger.debug("upload_video: saved -> %s video_url=%s", save_path, video_url)
+
+        return _finish_upload("video_url", video_url, candidate_id, question_set_id, qa_json, cid)
+
+    except Exception as e:
+        print("🔥 upload_video error:", e)
+        return jsonify({"error": str(e)}), 500
+
+# ==============================================
+# Submit Section
+# ==============================================
+# LLM evaluations for a section fan out over this pool (shared across requests)
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "8"))
+_eval_executor = ThreadPoolExecutor(max_workers=EVAL_WORKERS, thread_name_prefix="eval")
+
+
+# stored questions don't change; each entry holds the questions of a set that
+# submissions have asked for so far. save_generated_questions evicts the entry
+# when it adds to the set (in this worker; others catch up after the TTL)
+_question_meta_cache = TTLCache(ttl=int(os.getenv("QUESTION_META_CACHE_TTL", "300")), maxsize=512)
+
+# what submit_section reads of a stored question; positive_marking is the raw
+# JSON text (or None), text may be None
+QuestionMeta = namedtuple("QuestionMeta", "positive_marking text")
+
+
+def _load_question_meta(cursor, question_set_id, question_ids):
+    """{question_id: QuestionMeta} covering `question_ids` of a question set. Treat as read-only.
+
+    Only questions not already cached are fetched, and Postgres extracts the
+    two values scoring needs, so no question content crosses the wire.
+    """
+    cache_key = parse_uuid(question_set_id)
+    if not cache_key:
+        # can't match any stored question; don't send Postgres an invalid uuid
+        return {}
+    cached = _question_meta_cache.get(cache_key) or {}
+    missing = sorted({q for q in map(parse_uuid, question_ids) if q and q not in cached})
+    if not missing:
+        return cached
+
+    # top-level positive_marking wins over the one inside content; the text is
+    # the first non-empty of question / prompt_text / q_text
+    execute_prepared(cursor, "question_meta", """
+        SELECT q.id::text,
+               COALESCE(c.doc->>'positive_marking', c.doc->'content'->>'positive_marking'),
+               COALESCE(NULLIF(c.doc->'content'->>'question', ''),
+                        NULLIF(c.doc->'content'->>'prompt_text', ''),
+                        NULLIF(c.doc->'content'->>'q_text', ''))
+        FROM questions q
+        -- content saved as a JSON-encoded string decodes to the object itself
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN jsonb_typeof(q.content) = 'string'
+                        THEN (q.content #>> '{}')::jsonb ELSE q.content END AS doc
+        ) c
+        WHERE q.question_set_id = $1::uuid AND q.id = ANY($2::text[]::uuid[])
+    """, (question_set_id, missing))
+
+    # copy rather than mutate, other threads may be reading the cached dict
+    question_meta = dict(cached)
+    for qid, pos_mark, text in cursor.fetchall():
+        question_meta[qid] = QuestionMeta(pos_mark, text)
+
+    # ids that matched nothing aren't remembered; they may just not be saved yet
+    if len(question_meta) > len(cached):
+        _question_meta_cache.set(cache_key, question_meta)
+    return question_meta
+
+
+# MCQ/coding answers per batched LLM request; 1 disables batching
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "20"))
+
+
+def _response_answer(r):
+    answer = r.get("candidate_answer")
+    # accept alternative field names if frontend uses them
+    if not answer:
+        answer = r.get("answer") or r.get("response") or r.get("candidate_response") or r.get("transcript")
+    return answer
+
+
+# an MCQ answer identical to its correct answer (ignoring case and surrounding
+# whitespace) is marked correct here without asking the LLM; 0 sends every one
+MCQ_LOCAL_MATCH = os.getenv("MCQ_LOCAL_MATCH", "1") != "0"
+
+
+def _mcq_exact_match(correct, answer):
+    """Evaluation for an MCQ answer that matches the correct one exactly, else None.
+
+    Anything else (other option, same option written differently) is still
+    left to the LLM.
+    """
+    if not MCQ_LOCAL_MATCH or correct is None or answer is None or isinstance(answer, (dict, list)):
+        return None
+    correct_norm = str(correct).strip().casefold()
+    if correct_norm and correct_norm == str(answer).strip().casefold():
+        return {"is_correct": True, "score": 1, "feedback": "Correct answer."}
+    return None
+
+
+def _batch_evaluate(responses):
+    """Score the MCQ/coding responses in batched LLM calls; returns {response index: evaluation}.
+
+    Exact MCQ matches are scored without a call. Responses missing from the
+    result (failed batch, malformed entry) are left for _evaluate_response to
+    score one by one.
+    """
+    evaluations = {}
+    pending = []
+    for i, r in enumerate(responses):
+        qtype = r.get("question_type")
+        if qtype not in ["mcq", "coding"]:
+            continue
+        answer = _response_answer(r)
+        if qtype == "mcq":
+            local = _mcq_exact_match(r.get("correct_answer"), answer)
+            if local is not None:
+                evaluations[i] = local
+                continue
+        pending.append((i, {
+            "question_type": qtype,
+            "question_text": r.get("question_text"),
+            "correct_answer": r.get("correct_answer"),
+            "candidate_answer": answer,
+        }))
+    if EVAL_BATCH_SIZE < 2 or len(pending) < 2:
+        return evaluations
+    chunks = [pending[n:n + EVAL_BATCH_SIZE] for n in range(0, len(pending), EVAL_BATCH_SIZE)]
+
+    def run(chunk):
         try:
-            qa_data = json.loads(qa_raw)
+            return evaluate_answers_batch([item for _, item in chunk])
         except Exception:
-            qa_data = []
+            logger.warning("batched evaluation failed; scoring %d answers individually", len(chunk), exc_info=True)
+            return [None] * len(chunk)
 
-        safe = secure_filename(video_file.filename)
-        ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        final_name = f"{candidate_id}_{ts}_{safe}"
-        save_path = os.path.join(UPLOAD_DIR, final_name)
-        video_file.save(save_path)
-        video_url = f"/{UPLOAD_DIR}/{final_name}"
-        print(f"upload_video: saved -> {save_path} video_url={video_url}")
+    for chunk, results in zip(chunks, _eval_executor.map(run, chunks)):
+        for (i, _), evaluation in zip(chunk, results):
+            if evaluation is not None:
+                evaluations[i] = evaluation
+    return evaluations
 
-        conn = get_db_connection()
-        cur = conn.cursor()
 
-        # Try to update an existing attempt row first; otherwise insert.
-        # If `cid` column is missing, fall back to SQL without it.
+def _evaluate_response(r, evaluation=None):
+    """Score one submitted response; returns (qid, qtype, qtext, correct, answer, evaluation).
+
+    `evaluation` is a result already obtained from _batch_evaluate.
+    """
+    qid = r.get("question_id")
+    qtype = r.get("question_type")
+    qtext = r.get("question_text")
+    correct = r.get("correct_answer")
+    answer = _response_answer(r)
+
+    if qtype in ["mcq", "coding"]:
+        if evaluation is None:
+            try:
+                evaluation = evaluate_answer(
+                    question_type=qtype,
+                    question_text=qtext,
+                    correct_answer=correct,
+                    candidate_answer=answer,
+                )
+            except Exception:
+                evaluation = {"score": 0, "feedback": "Evaluation failed", "is_correct": False}
+
+    elif qtype in ["audio", "video"]:
+        # Use LLM-based evaluation for audio/video answers
         try:
-            cur.execute("""
-                UPDATE test_attempts
-                SET video_url = COALESCE(%s, video_url),
-                    qa_data = COALESCE(test_attempts.qa_data, '[]'::jsonb) || %s::jsonb,
-                    cid = COALESCE(%s, cid)
-                WHERE candidate_id = %s AND question_set_id = %s
-            """, (
-                video_url,
-                json.dumps(qa_data),
-                cid,
-                candidate_id,
-                question_set_id,
-            ))
-
-            if cur.rowcount == 0:
-                cur.execute("""
-                    INSERT INTO test_attempts (
-                        candidate_id, question_set_id, video_url, qa_data, cid
-                    ) VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    candidate_id,
-                    question_set_id,
-                    video_url,
-                    json.dumps(qa_data),
-                    cid
-                ))
-        except Exception as e:
-            msg = str(e).lower()
-            if 'column "cid" does not exist' in msg or 'cid' in msg and 'does not exist' in msg:
+            transcript = ""
+            if isinstance(answer, dict):
+                transcript = answer.get("transcript") or answer.get("text") or ""
+            else:
                 try:
-                    conn.rollback()
+                    parsed = jsonutil.loads(answer) if isinstance(answer, str) else None
+                    if isinstance(parsed, dict):
+                        transcript = parsed.get("transcript") or parsed.get("text") or ""
+                    else:
+                        transcript = str(answer or "")
                 except Exception:
-                    pass
-                cur.execute("""
-                    UPDATE test_attempts
-                    SET video_url = COALESCE(%s, video_url),
-                        qa_data = COALESCE(test_attempts.qa_data, '[]'::jsonb) || %s::jsonb
-                    WHERE candidate_id = %s AND question_set_id = %s
-                """, (
-                    video_url,
-                    json.dumps(qa_data),
-                    candidate_id,
-                    question_set_id,
-                ))
-
-                if cur.rowcount == 0:
-                    cur.execute("""
-                        INSERT INTO test_attempts (
-                            candidate_id, question_set_id, video_url, qa_data
-                        ) VALUES (%s, %s, %s, %s)
-                    """, (
-                        candidate_id,
-                        question_set_id,
-                        video_url,
-                        json.dumps(qa_data)
-                    ))
+                    transcript = str(answer or "")
+
+            # Use llm_client.evaluate_answer for AI-based scoring
+            evaluation = evaluate_answer(
+                question_type=qtype,
+                question_text=qtext,
+                correct_answer=correct,
+                candidate_answer=transcript
+            )
+            # Optionally, normalize output for frontend compatibility
+            if evaluation is None:
+                evaluation = {"score": 0, "feedback": "Evaluation failed", "is_correct": False}
             else:
-                raise
+                # Map LLM output to expected keys
+                if "score" not in evaluation:
+                    # Try to extract score from possible keys
+                    if "is_correct" in evaluation:
+                        evaluation["score"] = 1 if evaluation["is_correct"] else 0
+                    else:
+                        evaluation["score"] = 0
+                if "feedback" not in evaluation:
+                    evaluation["feedback"] = "No feedback"
+                if "is_correct" not in evaluation:
+                    # Consider score >= 0.6 as correct
+                    try:
+                        evaluation["is_correct"] = float(evaluation["score"]) >= 0.6
+                    except Exception:
+                        evaluation["is_correct"] = False
+        except Exception:
+            evaluation = {"score": 0, "feedback": "Audio/video evaluation failed", "is_correct": False}
 
-        conn.commit()
+    else:
+        evaluation = {"score": None, "feedback": "Not evaluated", "is_correct": False}
+    return qid, qtype, qtext, correct, answer, evaluation
 
-        return jsonify({"status": "success", "video_url": video_url}), 200
 
-    except Exception as e:
-        print("🔥 upload_video error:", e)
-        return jsonify({"error": str(e)}), 500
+# evaluator score -> question's positive_marking scale, by question type:
+# MCQ is all-or-nothing, coding is scored 0-10, audio/video (and anything
+# else) 0-1
+def _scale_mcq(evaluation, raw_score, pos_mark):
+    return pos_mark if evaluation.get("is_correct") else 0.0
+
+
+def _scale_coding(evaluation, raw_score, pos_mark):
+    return round(float(raw_score) / 10.0 * pos_mark, 3)
+
+
+def _scale_fraction(evaluation, raw_score, pos_mark):
+    return round(float(raw_score) * pos_mark, 3)
+
+
+_SCORE_SCALERS = {"mcq": _scale_mcq, "coding": _scale_coding}
 
-    finally:
-        if cur: cur.close()
-        if conn: conn.close()
 
-# ==============================================
-# Submit Section
-# ==============================================
 @test_bp.route("/test/submit_section", methods=["POST", "OPTIONS"])
 @test_bp.route("/test/submit_section/<question_set_id>", methods=["POST", "OPTIONS"])
 def submit_section(question_set_id=None):
@@ -883,181 +1400,49 @@ def submit_section(question_set_id=None):
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT id, content
-            FROM questions
-            WHERE question_set_id = %s
-        """, (question_set_id,))
-        rows = cursor.fetchall()
-
-        # Map question_id -> content dict (stored under content key)
-        question_meta = {}
-        for qid, raw in rows:
-            qid_str = str(qid)
-            try:
-                raw_json = json.loads(raw) if isinstance(raw, str) else raw
-            except Exception:
-                raw_json = raw
-            if isinstance(raw_json, dict):
-                content = raw_json.get("content") or {}
-                # merge top-level positive/negative markings into content for easier access
-                if raw_json.get("positive_marking") is not None:
-                    try:
-                        content["positive_marking"] = raw_json.get("positive_marking")
-                    except Exception:
-                        pass
-                if raw_json.get("negative_marking") is not None:
-                    try:
-                        content["negative_marking"] = raw_json.get("negative_marking")
-                    except Exception:
-                        pass
-            else:
-                content = {}
-            question_meta[qid_str] = content
+        question_meta = _load_question_meta(
+            cursor, question_set_id, [r.get("question_id") for r in responses]
+        ) if responses else {}
 
         results_out = []
 
-        # log raw incoming responses for debugging
-        try:
-            print("submit_section: raw_responses=", json.dumps(responses))
-        except Exception:
-            print("submit_section: raw_responses (non-serializable)=", responses)
-
-        for r in responses:
-            qid = r.get("question_id")
-            qtype = r.get("question_type")
-            qtext = r.get("question_text")
-            correct = r.get("correct_answer")
-            answer = r.get("candidate_answer")
-            # accept alternative field names if frontend uses them
-            if not answer:
-                answer = r.get("answer") or r.get("response") or r.get("candidate_response") or r.get("transcript")
-
-            if qtype in ["mcq", "coding"]:
-                try:
-                    evaluation = evaluate_answer(
-                        question_type=qtype,
-                        question_text=qtext,
-                        correct_answer=correct,
-                        candidate_answer=answer,
-                    )
-                except Exception:
-                    evaluation = {"score": 0, "feedback": "Evaluation failed", "is_correct": False}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("submit_section: raw_responses=%s", jsonutil.dumps(responses, default=str))
 
-            elif qtype in ["audio", "video"]:
-                # Use LLM-based evaluation for audio/video answers
-                try:
-                    transcript = ""
-                    if isinstance(answer, dict):
-                        transcript = answer.get("transcript") or answer.get("text") or ""
-                    else:
-                        try:
-                            parsed = json.loads(answer) if isinstance(answer, str) else None
-                            if isinstance(parsed, dict):
-                                transcript = parsed.get("transcript") or parsed.get("text") or ""
-                            else:
-                                transcript = str(answer or "")
-                        except Exception:
-                            transcript = str(answer or "")
-
-                    # Use llm_client.evaluate_answer for AI-based scoring
-                    from services.llm_client import evaluate_answer
-                    evaluation = evaluate_answer(
-                        question_type=qtype,
-                        question_text=qtext,
-                        correct_answer=correct,
-                        candidate_answer=transcript
-                    )
-                    # Optionally, normalize output for frontend compatibility
-                    if evaluation is None:
-                        evaluation = {"score": 0, "feedback": "Evaluation failed", "is_correct": False}
-                    else:
-                        # Map LLM output to expected keys
-                        if "score" not in evaluation:
-                            # Try to extract score from possible keys
-                            if "is_correct" in evaluation:
-                                evaluation["score"] = 1 if evaluation["is_correct"] else 0
-                            else:
-                                evaluation["score"] = 0
-                        if "feedback" not in evaluation:
-                            evaluation["feedback"] = "No feedback"
-                        if "is_correct" not in evaluation:
-                            # Consider score >= 0.6 as correct
-                            try:
-                                evaluation["is_correct"] = float(evaluation["score"]) >= 0.6
-                            except Exception:
-                                evaluation["is_correct"] = False
-                except Exception:
-                    evaluation = {"score": 0, "feedback": "Audio/video evaluation failed", "is_correct": False}
+        # MCQ/coding answers go to the LLM in batches; whatever is left
+        # (audio/video, batch misses) runs as concurrent single calls, so a
+        # section costs about one LLM round-trip instead of one per answer
+        batched = _batch_evaluate(responses)
+        evaluated = list(_eval_executor.map(
+            _evaluate_response, responses, [batched.get(i) for i in range(len(responses))]
+        ))
 
-            else:
-                evaluation = {"score": None, "feedback": "Not evaluated", "is_correct": False}
+        for qid, qtype, qtext, correct, answer, evaluation in evaluated:
             # Use question `positive_marking` as the scoring scale
+            meta = question_meta.get(str(qid))
             try:
-                meta = question_meta.get(str(qid)) or {}
-                print("$$$$$$$$$$$$$$$$$$$$$$4",question_meta)
-                print("-------------------",meta)
-                pos_mark = meta.get("positive_marking")
-                pos_mark = float(pos_mark) if pos_mark is not None else None
+                pos_mark = float(meta.positive_marking) if meta and meta.positive_marking is not None else None
             except Exception:
                 pos_mark = None
 
             raw_score = evaluation.get("score")
 
-            # If positive_marking is provided, convert evaluator raw score to that scale.
-            # - MCQ: if `is_correct` True -> full `pos_mark`, else 0 (all-or-nothing)
-            # - Coding: evaluator returns 0-10 -> scale to pos_mark via (raw/10)*pos_mark
-            # - Audio/Video: evaluator returns 0-1 -> scale via raw*pos_mark
-            try:
-                if pos_mark is not None and raw_score is not None:
-                    if qtype == "mcq":
-                        is_corr = evaluation.get("is_correct")
-                        evaluation["score"] = float(pos_mark) if is_corr else 0.0
-                    elif qtype == "coding":
-                        raw_f = float(raw_score)
-                        evaluation["score"] = round((raw_f / 10.0) * float(pos_mark), 3)
+            # without positive_marking the evaluator's score is kept (rounded)
+            if raw_score is not None:
+                try:
+                    if pos_mark is None:
+                        evaluation["score"] = round(float(raw_score), 3)
                     else:
-                        # audio/video or other types that return 0-1
-                        raw_f = float(raw_score)
-                        evaluation["score"] = round(raw_f * float(pos_mark), 3)
-                else:
-                    # No positive_marking provided: keep evaluator score as-is
-                    if raw_score is not None:
-                        # normalize coding to 0-10 representation if evaluator returned numeric
-                        if qtype == "coding":
-                            try:
-                                evaluation["score"] = round(float(raw_score), 3)
-                            except Exception:
-                                pass
-                        else:
-                            try:
-                                evaluation["score"] = round(float(raw_score), 3)
-                            except Exception:
-                                pass
-            except Exception:
-                pass
+                        evaluation["score"] = _SCORE_SCALERS.get(qtype, _scale_fraction)(evaluation, raw_score, pos_mark)
+                except (TypeError, ValueError):
+                    pass
 
-            # Debug/log: print marks information before persisting
-            try:
-                print(
-                    f"MARKS: candidate_id={candidate_id} question_id={qid} type={qtype} "
-                    f"raw_score={raw_score!r} positive_marking={pos_mark!r} final_score={evaluation.get('score')!r} "
-                    f"is_correct={evaluation.get('is_correct')!r}"
-                )
-            except Exception:
-                pass
+            logger.debug(
+                "MARKS: candidate_id=%s question_id=%s type=%s raw_score=%r positive_marking=%r final_score=%r is_correct=%r",
+                candidate_id, qid, qtype, raw_score, pos_mark, evaluation.get("score"), evaluation.get("is_correct"))
 
             # include question text where possible (prefer submitted question_text, otherwise metadata)
-            try:
-                q_meta = question_meta.get(str(qid)) if question_meta else {}
-            except Exception:
-                q_meta = {}
-
-            question_text_val = None
-            try:
-                question_text_val = qtext or q_meta.get('question') or q_meta.get('prompt_text') or q_meta.get('q_text')
-            except Exception:
-                question_text_val = qtext
+            question_text_val = qtext or (meta.text if meta else None)
 
             results_out.append({
                 "question_id": qid,
@@ -1071,82 +1456,32 @@ def submit_section(question_set_id=None):
                 "positive_marking": pos_mark
             })
 
-        # Log evaluation output for debugging
-        try:
-            print(f"submit_section: question_set_id={question_set_id} candidate_id={candidate_id}")
-            print("submit_section: question_meta_keys=", list(question_meta.keys()))
-            try:
-                print("submit_section: evaluations=", json.dumps(results_out))
-            except Exception:
-                print("submit_section: evaluations (non-serializable)=", results_out)
-        except Exception:
-            # don't break flow if logging fails
-            pass
-
-        # conn and cursor already open above
-        try:
-            cursor.execute("""
-                UPDATE test_attempts
-                SET results_data = COALESCE(test_attempts.results_data, '[]'::jsonb) || %s::jsonb,
-                    video_url = COALESCE(%s, video_url),
-                    audio_url = COALESCE(%s, audio_url),
-                    qa_data = COALESCE(test_attempts.qa_data, '[]'::jsonb),
-                    cid = COALESCE(%s, cid)
-                WHERE candidate_id = %s AND question_set_id = %s
-            """, (
-                json.dumps(results_out),
-                None,
-                None,
-                cid,
-                candidate_id,
-                question_set_id,
-            ))
-
-            if cursor.rowcount == 0:
-                cursor.execute("""
-                    INSERT INTO test_attempts (
-                        candidate_id, question_set_id, results_data, cid
-                    ) VALUES (%s, %s, %s, %s)
-                """, (
-                    candidate_id,
-                    question_set_id,
-                    json.dumps(results_out),
-                    cid
-                ))
-        except Exception as e:
-            msg = str(e).lower()
-            if 'column "cid" does not exist' in msg or 'cid' in msg and 'does not exist' in msg:
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-                cursor.execute("""
-                    UPDATE test_attempts
-                    SET results_data = COALESCE(test_attempts.results_data, '[]'::jsonb) || %s::jsonb,
-                        video_url = COALESCE(%s, video_url),
-                        audio_url = COALESCE(%s, audio_url),
-                        qa_data = COALESCE(test_attempts.qa_data, '[]'::jsonb)
-                    WHERE candidate_id = %s AND question_set_id = %s
-                """, (
-                    json.dumps(results_out),
-                    None,
-                    None,
-                    candidate_id,
-                    question_set_id,
-                ))
-
-                if cursor.rowcount == 0:
-                    cursor.execute("""
-                        INSERT INTO test_attempts (
-                            candidate_id, question_set_id, results_data
-                        ) VALUES (%s, %s, %s)
-                    """, (
-                        candidate_id,
-                        question_set_id,
-                        json.dumps(results_out)
-                    ))
-            else:
-                raise
+        logger.info("submit_section: question_set_id=%s candidate_id=%s evaluated=%d",
+                    question_set_id, candidate_id, len(results_out))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("submit_section: evaluations=%s", jsonutil.dumps(results_out, default=str))
+
+        results_json = jsonutil.dumps(results_out)
+
+        # conn and cursor already open above; update-or-insert in one statement
+        sectioned = _has_attempt_sections(cursor)
+        if sectioned:
+            # the section gets its own row below; the attempt row isn't rewritten
+            updates = [("qa_data = COALESCE(test_attempts.qa_data, %s::jsonb)", "[]")]
+            inserts = [("results_data", "[]")]
+        else:
+            updates = [
+                ("results_data = COALESCE(test_attempts.results_data, '[]'::jsonb) || %s::jsonb", results_json),
+                ("qa_data = COALESCE(test_attempts.qa_data, %s::jsonb)", "[]"),
+            ]
+            inserts = [("results_data", results_json)]
+        attempt_id = _upsert_attempt(cursor, candidate_id, question_set_id, updates, inserts, cid)
+
+        if sectioned:
+            execute_prepared(cursor, "insert_attempt_section", """
+                INSERT INTO test_attempt_sections (attempt_id, section_name, results_data)
+                VALUES ($1, $2, $3::jsonb)
+            """, (attempt_id, section_name, results_json))
 
         conn.commit()
 
@@ -1156,44 +1491,19 @@ def submit_section(question_set_id=None):
             job_id = data.get("job_id") or data.get("jobId")
             if mark_complete:
                 try:
-                    print('submit_section: mark_complete detected; details ->', {
-                        'candidate_id': candidate_id,
-                        'cid': cid,
-                        'question_set_id': question_set_id,
-                        'job_id': job_id,
-                        'mark_complete': mark_complete,
-                        'data_keys': list(data.keys())
-                    })
+                    logger.debug("submit_section: mark_complete detected; candidate_id=%s cid=%s question_set_id=%s job_id=%s",
+                                 candidate_id, cid, question_set_id, job_id)
                     _ensure_candidate_taken_table(conn)
-                    chk = conn.cursor()
                     # Insert only if not already present for this candidate (or cid) and question_set
-                    chk.execute(
-                        "SELECT 1 FROM candidate_test_taken WHERE (candidate_id = %s OR cid = %s) AND question_set_id = %s LIMIT 1",
-                        (candidate_id, cid, question_set_id)
-                    )
-                    exists = chk.fetchone()
-                    if not exists:
-                        try:
-                            chk.execute(
-                                "INSERT INTO candidate_test_taken (candidate_id, job_id, question_set_id, cid) VALUES (%s, %s, %s, %s)",
-                                (candidate_id, job_id, question_set_id, cid)
-                            )
-                            conn.commit()
-                            print(f"Inserted candidate_test_taken: candidate_id={candidate_id} job_id={job_id} question_set_id={question_set_id} cid={cid}")
-                        except Exception as ins_ex:
-                            print('submit_section: insert into candidate_test_taken failed:', ins_ex)
-                            try:
-                                conn.rollback()
-                            except Exception:
-                                pass
+                    inserted = _mark_test_taken(cursor, candidate_id, job_id, question_set_id, cid)
+                    conn.commit()
+                    if inserted:
+                        logger.info("Inserted candidate_test_taken: candidate_id=%s job_id=%s question_set_id=%s cid=%s",
+                                    candidate_id, job_id, question_set_id, cid)
                     else:
-                        print('submit_section: candidate_test_taken entry already exists for candidate/question_set; no insert performed.')
-                    try:
-                        chk.close()
-                    except Exception:
-                        pass
+                        logger.debug("submit_section: candidate_test_taken entry already exists; no insert performed")
                 except Exception as e:
-                    print('submit_section: error while handling mark_complete ->', e)
+                    logger.warning("submit_section: error while handling mark_complete: %s", e)
                     try:
                         conn.rollback()
                     except Exception:
@@ -1204,12 +1514,12 @@ def submit_section(question_set_id=None):
         return jsonify({"message": "Section stored", "evaluations": results_out}), 200
 
     except Exception as e:
-        print("🔥 submit_section error:", e)
+        logger.exception("submit_section error")
         return jsonify({"error": str(e)}), 500
 
     finally:
         if cursor: cursor.close()
-        if conn: conn.close()
+        release_db_connection(conn)
 
 # ==============================================
 # Save Full Test Details (role, skills, exp, schedule)
@@ -1235,43 +1545,41 @@ def save_test_details():
     cur = None
     try:
         conn = get_db_connection()
+        # single statement: let it commit on its own instead of BEGIN/COMMIT round-trips
+        conn.autocommit = True
         cur = conn.cursor()
 
-        # Update if exists, else insert (avoid relying on ON CONFLICT index)
-        cur.execute("""
-            UPDATE candidate_test_details
-            SET role_title = %s,
-                skills = %s,
-                experience = %s,
-                work_arrangement = %s,
-                location = %s,
-                annual_compensation = %s,
-                test_start = %s,
-                test_end = %s
-            WHERE candidate_id = %s AND question_set_id = %s
+        # Update if exists, else insert (avoid relying on ON CONFLICT index);
+        # the UPDATE runs as a writable CTE so both happen in one round-trip
+        execute_prepared(cur, "save_test_details", """
+            WITH upd AS (
+                UPDATE candidate_test_details
+                SET role_title = $3,
+                    skills = $4,
+                    experience = $5,
+                    work_arrangement = $6,
+                    location = $7,
+                    annual_compensation = $8,
+                    test_start = $9,
+                    test_end = $10
+                WHERE candidate_id = $1 AND question_set_id = $2
+                RETURNING 1
+            )
+            INSERT INTO candidate_test_details (
+                candidate_id, question_set_id,
+                role_title, skills, experience,
+                work_arrangement, location, annual_compensation,
+                test_start, test_end
+            )
+            SELECT $1, $2, $3, $4, $5, $6, $7, $8, $9, $10
+            WHERE NOT EXISTS (SELECT 1 FROM upd)
         """, (
+            candidate_id, question_set_id,
             role_title, skills, experience,
             work_arrangement, location, annual_compensation,
-            test_start, test_end,
-            candidate_id, question_set_id
+            test_start, test_end
         ))
-        if cur.rowcount == 0:
-            cur.execute("""
-                INSERT INTO candidate_test_details (
-                    candidate_id, question_set_id,
-                    role_title, skills, experience,
-                    work_arrangement, location, annual_compensation,
-                    test_start, test_end
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                candidate_id,
-                question_set_id,
-                role_title, skills, experience,
-                work_arrangement, location, annual_compensation,
-                test_start, test_end
-            ))
 
-        conn.commit()
         return jsonify({"message": "Test details saved successfully", "candidate_id": candidate_id, "question_set_id": question_set_id}), 200
 
     except Exception as e:
@@ -1280,7 +1588,7 @@ def save_test_details():
 
     finally:
         if cur: cur.close()
-        if conn: conn.close()
+        release_db_connection(conn)
 
 # ==============================================
 # Save Generated Questions
@@ -1294,6 +1602,9 @@ def save_generated_questions():
 
     if not isinstance(questions, list):
         return jsonify({"error": "questions must be a list"}), 400
+    question_set_id = parse_uuid(question_set_id)
+    if not question_set_id:
+        return jsonify({"error": "question_set_id must be a UUID"}), 400
 
     conn = None
     cur = None
@@ -1301,8 +1612,8 @@ def save_generated_questions():
         conn = get_db_connection()
         cur = conn.cursor()
 
+        rows = []
         for q in questions:
-            qid = uuid.uuid4()
             # ensure content is stored under a consistent shape
             content = q.get("content") if isinstance(q, dict) else q
             # allow top-level fields like type/skill to be at root
@@ -1315,17 +1626,18 @@ def save_generated_questions():
                 "negative_marking": q.get("negative_marking"),
                 "content": content
             }
+            rows.append((question_set_id, jsonutil.dumps(entry)))
 
-            cur.execute("""
-                INSERT INTO questions (id, question_set_id, content)
-                VALUES (%s, %s, %s)
-            """, (
-                qid,
-                uuid.UUID(question_set_id),
-                json.dumps(entry)
-            ))
+        # ids come from the column default (gen_random_uuid(), migration 007)
+        if rows:
+            execute_values(cur, """
+                INSERT INTO questions (question_set_id, content)
+                VALUES %s
+            """, rows, page_size=500)
 
         conn.commit()
+        _question_meta_cache.delete(question_set_id)
+        _start_payload_cache.delete(question_set_id)
         return jsonify({"message": "Questions saved successfully", "question_set_id": question_set_id}), 200
 
     except Exception as e:
@@ -1334,7 +1646,7 @@ def save_generated_questions():
 
     finally:
         if cur: cur.close()
-        if conn: conn.close()
+        release_db_connection(conn)
 
 # ==============================================
 # Optional: Create session - returns candidate_id & question_set_id
@@ -1346,34 +1658,32 @@ def create_session():
     question_set_id = data.get("question_set_id") or str(uuid.uuid4())
     cid = data.get("cid")
 
+    conn = None
+    cur = None
     try:
         conn = get_db_connection()
+        # single statement: let it commit on its own instead of BEGIN/COMMIT round-trips
+        conn.autocommit = True
         cur = conn.cursor()
         # create a placeholder row in test_attempts if none exists
-        cur.execute("""
-            SELECT 1 FROM test_attempts WHERE candidate_id = %s AND question_set_id = %s
-        """, (candidate_id, question_set_id))
-        if cur.fetchone() is None:
-            try:
-                cur.execute("""
-                    INSERT INTO test_attempts (candidate_id, question_set_id, cid)
-                    VALUES (%s, %s, %s)
-                """, (candidate_id, question_set_id, cid))
-                conn.commit()
-            except Exception as e:
-                msg = str(e).lower()
-                if 'column "cid" does not exist' in msg or 'cid' in msg and 'does not exist' in msg:
-                    try:
-                        conn.rollback()
-                    except Exception:
-                        pass
-                    cur.execute("""
-                        INSERT INTO test_attempts (candidate_id, question_set_id)
-                        VALUES (%s, %s)
-                    """, (candidate_id, question_set_id))
-                    conn.commit()
-                else:
-                    raise
+        values = {"candidate_id": candidate_id, "question_set_id": question_set_id}
+        if "cid" in table_columns(cur, "test_attempts"):
+            values["cid"] = cid
+        cols = ", ".join(values)
+        marks = ", ".join(["%s"] * len(values))
+        if attempts_keyed(cur):
+            cur.execute(f"""
+                INSERT INTO test_attempts ({cols}) VALUES ({marks})
+                ON CONFLICT (candidate_id, question_set_id) DO NOTHING
+            """, tuple(values.values()))
+        else:
+            cur.execute(f"""
+                INSERT INTO test_attempts ({cols})
+                SELECT {marks}
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM test_attempts WHERE candidate_id = %s AND question_set_id = %s
+                )
+            """, (*values.values(), candidate_id, question_set_id))
 
         return jsonify({"candidate_id": candidate_id, "question_set_id": question_set_id}), 200
 
@@ -1382,5 +1692,5 @@ def create_session():
         return jsonify({"error": str(e)}), 500
 
     finally:
-        if 'cur' in locals(): cur.close()
-        if 'conn' in locals(): conn.close()
\ No newline at end of file
+        if cur: cur.close()
+        release_db_connection(conn)
\ No newline at end of file
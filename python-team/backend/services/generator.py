@@ -1,23 +1,99 @@
+import os
 import re
+import string
 import uuid
 import logging
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
-from services.llm_client import generate_question
+from services.llm_client import generate_question, generate_questions_batch
 
 logger = logging.getLogger(__name__)
 
+# LLM calls in flight per generate_questions() request; they are network-bound,
+# so this is limited by the provider's rate limit rather than by CPU
+GEN_CONCURRENCY = int(os.getenv("GEN_CONCURRENCY", "16"))
+# batched runs (background jobs): skill/type/difficulty combinations asked for
+# at least GEN_BATCH_MIN times are generated GEN_BATCH_SIZE to a request
+# (either set to 0 = always one question per request)
+GEN_BATCH_MIN = int(os.getenv("GEN_BATCH_MIN", "4"))
+GEN_BATCH_SIZE = int(os.getenv("GEN_BATCH_SIZE", "10"))
 
-def generate_questions(payload):
+_PUNCT_RE = re.compile(r"[^\w\s]")
+# the same characters _PUNCT_RE removes, for the (usual) all-ASCII case
+_ASCII_PUNCT = str.maketrans("", "", string.punctuation.replace("_", ""))
+
+
+def _normalize_text(val):
+    """Lowercase, strip punctuation and collapse whitespace; used to spot duplicate questions."""
+    if not val:
+        return ""
+    s = str(val).lower()
+    s = s.translate(_ASCII_PUNCT) if s.isascii() else _PUNCT_RE.sub("", s)
+    return " ".join(s.split())
+
+
+# the text two questions are compared on when checking for duplicates, by type
+def _mcq_text(q_data):
+    q_text = q_data.get("question") or q_data.get("prompt") or q_data.get("prompt_text") or ""
+    opts = " ".join(q_data.get("options", []) or [])
+    return f"{q_text} {opts}".strip()
+
+
+def _coding_text(q_data):
+    q_text = q_data.get("question") or q_data.get("prompt") or ""
+    input_spec = q_data.get("input_spec", "") or ""
+    output_spec = q_data.get("output_spec", "") or ""
+    return f"{q_text} {input_spec} {output_spec}".strip()
+
+
+def _prompt_text(q_data):
+    return q_data.get("question") or q_data.get("prompt_text") or q_data.get("prompt") or str(q_data)
+
+
+_REP_TEXT = {"mcq": _mcq_text, "coding": _coding_text}
+
+
+def _representative_text(qtype, q_data):
+    if not isinstance(q_data, dict):
+        return str(q_data)
+    return _REP_TEXT.get(qtype, _prompt_text)(q_data)
+
+
+def _prefetch(tasks, on_progress=None):
+    """Questions for repeated tasks, fetched several per LLM request: {task: [question, ...]}.
+
+    on_progress(0, len(tasks)) is called as each batch finishes: no question
+    is assembled yet, but a background job's poller can see it is alive.
+    """
+    chunks = [(task, min(GEN_BATCH_SIZE, n - i))
+              for task, n in Counter(tasks).items() if n >= GEN_BATCH_MIN
+              for i in range(0, n, GEN_BATCH_SIZE)]
+    prefetched = {}
+    if not chunks:
+        return prefetched
+    with ThreadPoolExecutor(max_workers=min(GEN_CONCURRENCY, len(chunks))) as ex:
+        futures = {ex.submit(generate_questions_batch, *task, count=count): task for task, count in chunks}
+        for fut in as_completed(futures):
+            prefetched.setdefault(futures[fut], []).extend(fut.result())
+            if on_progress is not None:
+                on_progress(0, len(tasks))
+    return prefetched
+
+
+def generate_questions(payload, batched=False, on_progress=None):
     """Generate questions in parallel while avoiding duplicates.
 
     - Uses a thread pool for parallel LLM calls (bounded by total questions).
     - Keeps a thread-safe `seen_texts` set to deduplicate generated content.
+    - batched=True trades latency for fewer LLM requests (see GEN_BATCH_MIN).
+    - on_progress(done, total) is called as each question finishes.
     """
     skills = payload.get("skills", [])
     global_settings = payload.get("global_settings", {"mcq_options": 4})
 
     # Build a flat list of generation tasks
+    mcq_options = global_settings.get("mcq_options", 4)
     tasks = []  # items are (skill_name, difficulty, qtype, options)
     for skill in skills:
         name = skill.get("name")
@@ -30,8 +106,7 @@ def generate_questions(payload):
                 num = int(num)
             except Exception:
                 num = 0
-            for _ in range(max(0, num)):
-                tasks.append((name, difficulty, qtype, global_settings.get("mcq_options", 4)))
+            tasks.extend([(name, difficulty, qtype, mcq_options)] * max(0, num))
 
     if not tasks:
         return []
@@ -39,31 +114,38 @@ def generate_questions(payload):
     # Thread-safe deduplication set
     seen_texts = set()
     seen_lock = threading.Lock()
-
-    def _normalize_text(val):
-        if not val:
-            return ""
-        s = str(val).lower().strip()
-        s = re.sub(r"[^\w\s]", "", s)
-        s = re.sub(r"\s+", " ", s)
-        return s
+    # also guarded by seen_lock
+    prefetched = _prefetch(tasks, on_progress) if batched and GEN_BATCH_MIN > 0 and GEN_BATCH_SIZE > 0 else {}
 
     def _create_one(name, difficulty, qtype, options):
+        # a cached variant is fine as long as this set hasn't used it yet
+        def _already_used(q_data):
+            return _normalize_text(_representative_text(qtype, q_data)) in seen_texts
+
         # Try multiple times to get a unique, valid question
         attempts = 0
         last_rep = None
+        # after a duplicate, the retry asks for something different from it
+        avoid = None
+        # after a reply with no question text, the retry skips the cache
+        nocache = False
         while attempts < 5:
             attempts += 1
             try:
-                logger.debug(f"Attempt {attempts}/5: Generating {qtype} for skill={name}, difficulty={difficulty}")
-                q_data = generate_question(skill=name, difficulty=difficulty, qtype=qtype, options=options)
+                logger.debug("Attempt %d/5: Generating %s for skill=%s, difficulty=%s", attempts, qtype, name, difficulty)
+                with seen_lock:
+                    pending = prefetched.get((name, difficulty, qtype, options))
+                    q_data = pending.pop() if pending else None
+                if q_data is None:
+                    q_data = generate_question(skill=name, difficulty=difficulty, qtype=qtype, options=options,
+                                               nocache=nocache, exclude=_already_used, avoid=avoid)
             except Exception as e:
-                logger.error(f"Exception in generate_question (attempt {attempts}): {str(e)}")
+                logger.error("Exception in generate_question (attempt %d): %s", attempts, e)
                 q_data = None
 
             if q_data is None:
                 # fallback content
-                logger.warning(f"generate_question returned None for {name}/{qtype}/{difficulty} (attempt {attempts}). Using fallback.")
+                logger.warning("generate_question returned None for %s/%s/%s (attempt %d). Using fallback.", name, qtype, difficulty, attempts)
                 if qtype == "audio":
                     q_data = {"prompt_text": f"Describe a situation where you used {name} effectively.", "type": "audio"}
                 elif qtype == "video":
@@ -71,31 +153,17 @@ def generate_questions(payload):
                 else:
                     q_data = {"prompt": f"Generate a question for {name}", "type": qtype}
 
-            # Build representative text
-            rep = ""
-            if isinstance(q_data, dict):
-                if qtype == "mcq":
-                    q_text = q_data.get("question") or q_data.get("prompt") or q_data.get("prompt_text") or ""
-                    opts = " ".join(q_data.get("options", []) or [])
-                    rep = f"{q_text} {opts}".strip()
-                elif qtype == "coding":
-                    q_text = q_data.get("question") or q_data.get("prompt") or ""
-                    input_spec = q_data.get("input_spec", "") or ""
-                    output_spec = q_data.get("output_spec", "") or ""
-                    rep = f"{q_text} {input_spec} {output_spec}".strip()
-                else:
-                    rep = q_data.get("question") or q_data.get("prompt_text") or q_data.get("prompt") or str(q_data)
-            else:
-                rep = str(q_data)
-
+            rep = _representative_text(qtype, q_data)
             norm = _normalize_text(rep)
             last_rep = rep
             if not norm:
+                nocache = True
                 continue
 
             with seen_lock:
                 if norm in seen_texts:
                     # duplicate, try again
+                    avoid = rep[:200]
                     continue
                 seen_texts.add(norm)
 
@@ -129,17 +197,18 @@ def generate_questions(payload):
         }
 
     # Run tasks in a bounded thread pool
-    max_workers = min(8, len(tasks))
-    results = []
+    max_workers = min(GEN_CONCURRENCY, len(tasks))
+    # in task order, whichever finishes first
+    results = [None] * len(tasks)
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        future_to_task = {ex.submit(_create_one, *t): t for t in tasks}
-        for fut in as_completed(future_to_task):
+        future_to_index = {ex.submit(_create_one, *t): i for i, t in enumerate(tasks)}
+        for done, fut in enumerate(as_completed(future_to_index), 1):
             try:
-                res = fut.result()
-                if res:
-                    results.append(res)
+                results[future_to_index[fut]] = fut.result()
             except Exception:
                 # on unexpected failure, skip this question
-                continue
+                pass
+            if on_progress is not None:
+                on_progress(done, len(tasks))
 
-    return results
+    return [res for res in results if res]
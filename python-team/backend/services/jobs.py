@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import db_connection
+from utils import jsonutil
+from utils.ids import gen_uuid, parse_uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# finished jobs are kept this long so clients have time to poll for the result
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+# a running job with no update (state or progress) for this long lost its
+# worker (restart, crash) and is reported as failed
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# a queued job sends no updates while it waits behind JOB_WORKERS running
+# ones, so it is only given up on once it was submitted this long ago
+JOB_QUEUE_SECONDS = int(os.getenv("JOB_QUEUE_SECONDS", "1800"))
+# progress is written at most this often per job
+_PROGRESS_INTERVAL = 1.0
+
+# jobs run in the worker process that accepted them, but their state lives in
+# Postgres: with several gunicorn workers the poll can land on any of them
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def _ensure_table(cur):
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS background_jobs (
+                id uuid PRIMARY KEY,
+                state text NOT NULL,
+                result jsonb,
+                error text,
+                progress jsonb,
+                created_at timestamptz NOT NULL DEFAULT now(),
+                updated_at timestamptz NOT NULL DEFAULT now(),
+                finished_at timestamptz
+            )
+        """)
+        _table_ready = True
+
+
+def _update(job_id, **fields):
+    """Set columns of one job row; jsonb values are passed already encoded."""
+    assignments = ", ".join(f"{col} = %s" + ("::jsonb" if col in ("result", "progress") else "")
+                            for col in fields)
+    with db_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"UPDATE background_jobs SET {assignments}, updated_at = now() WHERE id = %s",
+                        (*fields.values(), job_id))
+
+
+def _run(job_id, fn, args, kwargs):
+    try:
+        _update(job_id, state="running")
+        result = fn(*args, **kwargs)
+        update = {"state": "done", "result": jsonutil.dumps(result, default=str)}
+    except Exception as e:
+        logger.exception("Background job %s failed", job_id)
+        update = {"state": "failed", "error": str(e)}
+    try:
+        with db_connection() as conn:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("UPDATE background_jobs SET state = %s, result = %s::jsonb, error = %s, "
+                            "updated_at = now(), finished_at = now() WHERE id = %s",
+                            (update["state"], update.get("result"), update.get("error"), job_id))
+    except Exception:
+        logger.exception("Could not record the outcome of background job %s", job_id)
+
+
+def _progress_reporter(job_id):
+    last = [0.0]
+
+    def on_progress(done, total):
+        now = time.monotonic()
+        if done < total and now - last[0] < _PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        try:
+            _update(job_id, progress=jsonutil.dumps({"done": done, "total": total}))
+        except Exception as e:
+            # progress is best-effort; the job itself carries on
+            logger.warning("progress update for job %s failed: %s", job_id, e)
+    return on_progress
+
+
+def submit_job(fn, *args, with_progress=False):
+    """Run fn(*args) on the background pool and return a job id to poll.
+
+    with_progress=True also passes fn an `on_progress(done, total)` callback
+    whose latest values get_job() reports under "progress".
+    """
+    job_id = gen_uuid()
+    with db_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            _ensure_table(cur)
+            cur.execute("DELETE FROM background_jobs WHERE coalesce(finished_at, created_at) "
+                        "< now() - make_interval(secs => %s)", (JOB_TTL_SECONDS,))
+            cur.execute("INSERT INTO background_jobs (id, state) VALUES (%s, 'queued')", (job_id,))
+    kwargs = {}
+    if with_progress:
+        kwargs["on_progress"] = _progress_reporter(job_id)
+    _executor.submit(_run, job_id, fn, args, kwargs)
+    return job_id
+
+
+def get_job(job_id):
+    """Return a snapshot of the job, or None if it is unknown or expired."""
+    job_id = parse_uuid(job_id)
+    if job_id is None:
+        return None
+    with db_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            _ensure_table(cur)
+            cur.execute("""
+                SELECT state, result, error, progress,
+                       (state = 'running' AND updated_at < now() - make_interval(secs => %s))
+                       OR (state = 'queued' AND created_at < now() - make_interval(secs => %s)) AS stale
+                FROM background_jobs
+                WHERE id = %s AND coalesce(finished_at, created_at) >= now() - make_interval(secs => %s)
+            """, (JOB_STALE_SECONDS, JOB_QUEUE_SECONDS, job_id, JOB_TTL_SECONDS))
+            row = cur.fetchone()
+    if row is None:
+        return None
+    state, result, error, progress, stale = row
+    if stale and state == "queued":
+        state, error = "failed", "The job was never started; the worker that accepted it stopped"
+    elif stale:
+        state, error = "failed", "The worker running this job stopped before it finished"
+    return {"state": state, "result": result, "error": error, "progress": progress}
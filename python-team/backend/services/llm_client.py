@@ -1,19 +1,91 @@
+import os
+import copy
 import requests
 import json
 import re
 import logging
+import threading
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from config import OPENROUTER_API_KEY, OPENROUTER_URL, OPENROUTER_MODEL
+from utils import jsonutil
+from utils.cache import TTLCache
+from services import llm_disk_cache
+from services.rate_limiter import WindowLimiter
 
 logger = logging.getLogger(__name__)
 
 # Create a session with retries to avoid repeating code and improve resilience
 _session = requests.Session()
-retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
-adapter = HTTPAdapter(max_retries=retries)
+# urllib3 leaves POST out of its retryable methods by default, which silently
+# disabled the status retries for every chat completion. 429/5xx mean the
+# request wasn't served, so those are safe to resend (waiting for Retry-After
+# when given); a read timeout may have been billed, so it is not retried
+retries = Retry(total=3, read=0, backoff_factor=0.5, backoff_jitter=0.25,
+                status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset({"POST"}),
+                raise_on_status=False)
+# kept-alive connections to the LLM host; generation, evaluation and job threads
+# all share this session, and with requests' default of 10 the rest would each
+# open (and then throw away) a fresh TLS connection
+LLM_HTTP_POOL = int(os.getenv("LLM_HTTP_POOL", "64"))
+adapter = HTTPAdapter(max_retries=retries, pool_connections=4, pool_maxsize=LLM_HTTP_POOL)
 _session.mount("https://", adapter)
 _session.mount("http://", adapter)
+# sent with every call; the body is already-encoded JSON (see _post)
+_session.headers.update({
+    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+    "Content-Type": "application/json"
+})
+
+# client-side share of the account's OpenRouter limits (0 = no limit). Each
+# worker process enforces its own window and they don't coordinate, so set
+# these to the account limit divided by GUNICORN_WORKERS (and by the number of
+# app servers), e.g. LLM_RPM=50 on 4 workers for a 200 RPM account
+_request_limiter = WindowLimiter(int(os.getenv("LLM_RPM", "0")))
+_token_limiter = WindowLimiter(int(os.getenv("LLM_TPM", "0")))
+# (connect, read) seconds: fail fast when the host is unreachable, but give the
+# model its full minute to answer
+LLM_TIMEOUT = (float(os.getenv("LLM_CONNECT_TIMEOUT", "10")), float(os.getenv("LLM_READ_TIMEOUT", "60")))
+# calls in flight at once across generation, evaluation and job threads
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "0"))
+_in_flight = threading.BoundedSemaphore(LLM_MAX_CONCURRENT) if LLM_MAX_CONCURRENT > 0 else None
+
+
+def warm_connection():
+    """Open a keep-alive connection to the LLM host in the background.
+
+    Moves the DNS/TCP/TLS handshake off the first real request. Call it once
+    per worker process (create_app does), never before a fork.
+    """
+    def _warm():
+        try:
+            # any reply will do (the endpoint only serves POST); it's the socket
+            # left in the pool that matters
+            _session.head(OPENROUTER_URL, timeout=5)
+        except requests.exceptions.RequestException as e:
+            logger.info("LLM connection not pre-warmed: %s", e)
+    threading.Thread(target=_warm, name="llm-warm", daemon=True).start()
+
+
+def _post(payload):
+    """POST a chat completion, first waiting for room under LLM_RPM / LLM_TPM / LLM_MAX_CONCURRENT.
+
+    429/5xx replies are retried by the session's Retry, which honours Retry-After.
+    """
+    # ~4 characters per token for the prompt, plus the most the reply may use
+    prompt_chars = sum(len(m["content"]) for m in payload["messages"])
+    _request_limiter.acquire()
+    _token_limiter.acquire(prompt_chars // 4 + payload.get("max_tokens", 0))
+    body = jsonutil.dumps(payload).encode()
+    if _in_flight is None:
+        return _session.post(OPENROUTER_URL, data=body, timeout=LLM_TIMEOUT)
+    with _in_flight:
+        return _session.post(OPENROUTER_URL, data=body, timeout=LLM_TIMEOUT)
+
+
+# system messages shared by every request of a kind (only serialized, never mutated)
+_GEN_SYSTEM = {"role": "system", "content": "You are a helpful interview question generator."}
+_EVAL_SYSTEM = {"role": "system", "content": "You are a strict and fair evaluator for technical questions."}
 
 PROMPTS = {
     "mcq": (
@@ -37,6 +109,37 @@ PROMPTS = {
     ),
 }
 
+# generated questions by (model, qtype, skill, difficulty, options): up to
+# LLM_CACHE_VARIANTS distinct ones per key, so a client retrying the same
+# generation, or a set asking for several questions of one kind, reuses
+# earlier LLM calls instead of paying for them again
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_VARIANTS = int(os.getenv("LLM_CACHE_VARIANTS", "8"))
+_question_cache = TTLCache(ttl=int(os.getenv("LLM_CACHE_TTL", "300")), maxsize=2048)
+_question_cache_lock = threading.Lock()
+
+_json_decoder = json.JSONDecoder()
+# "Generate ONE <kind> question" in PROMPTS, reworded for several at once
+_ONE_QUESTION_RE = re.compile(r"Generate ONE (.*?) question\b")
+
+
+def _find_json(text, opener="{", max_tries=20):
+    """Decode the first complete JSON value starting with `opener` ('{' or '[') in `text`.
+
+    Works from each opener in turn with the stdlib's C scanner, which stops at
+    the end of the value, so prose or a second block after it doesn't matter.
+    Returns None if nothing decodes.
+    """
+    i = text.find(opener)
+    while i != -1 and max_tries > 0:
+        try:
+            return _json_decoder.raw_decode(text, i)[0]
+        except ValueError:
+            i = text.find(opener, i + 1)
+            max_tries -= 1
+    return None
+
+
 def _extract_json_from_text(text: str):
     """Try to extract the first JSON object from a string.
     Falls back to returning None if no JSON is found.
@@ -47,115 +150,223 @@ def _extract_json_from_text(text: str):
     text = text.strip()
     if (text.startswith("{") and text.endswith("}")) or (text.startswith("[") and text.endswith("]")):
         try:
-            return json.loads(text)
+            return jsonutil.loads(text)
         except Exception:
             pass
 
-    # Search for the first {...} block
-    match = re.search(r"(\{.*\})", text, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except Exception:
-            pass
-    return None
+    # Search for the first {...} block; usually the reply is one object inside
+    # a ```json fence or a sentence, so try the widest slice whole (orjson)
+    # before scanning opener by opener
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        return jsonutil.loads(text[start:end + 1])
+    except ValueError:
+        return _find_json(text[start:end + 1], "{")
 
 
-def generate_question(skill: str, difficulty: str, qtype: str, options: int = 4):
-    prompt_text = PROMPTS.get(qtype, PROMPTS.get("mcq")).format(skill=skill, difficulty=difficulty, options=options)
+# spellings of one skill that should share cache entries: "React.js", "ReactJS"
+# and "react js" all become "reactjs"; symbols that tell skills apart (C, C++,
+# C#) are kept
+_CACHE_NAME_STRIP_RE = re.compile(r"[\s.\-_]+")
+
+
+def _cache_name(value):
+    return _CACHE_NAME_STRIP_RE.sub("", str(value).casefold())
+
+
+def _has_text(question):
+    """False for a reply with no question text, which must not be cached or served from it."""
+    if not isinstance(question, dict):
+        return False
+    text = question.get("question") or question.get("prompt_text") or question.get("prompt")
+    return bool(text and str(text).strip())
+
+
+def _cached_variants(key):
+    """Cached questions for `key`: this process's memory first, then the disk cache if enabled."""
+    variants = _question_cache.get(key)
+    if variants is None:
+        # entries written before empty replies were filtered out are skipped too
+        variants = tuple(v for v in llm_disk_cache.get(key) or () if _has_text(v))
+        if variants:
+            _question_cache.set(key, variants)
+    return variants
+
+
+def generate_question(skill: str, difficulty: str, qtype: str, options: int = 4,
+                      nocache: bool = False, exclude=None, avoid: str = None):
+    """Generate one question via the LLM; returns the normalized dict or None.
+
+    A cached variant for the same arguments is returned instead when there is
+    one that `exclude(question)` (if given) doesn't reject, e.g. because the
+    caller already used it. nocache=True always asks the LLM, as does `avoid`:
+    the text of a question the new one must differ from.
+    """
+    key = (OPENROUTER_MODEL, qtype, _cache_name(skill), _cache_name(difficulty), options)
+    if LLM_CACHE_ENABLED and not nocache and not avoid:
+        for cached in _cached_variants(key):
+            if exclude is None or not exclude(cached):
+                logger.debug("generate_question cache hit: %s", key)
+                return copy.deepcopy(cached)
+
+    result = _generate_question(skill, difficulty, qtype, options, avoid)
+    if LLM_CACHE_ENABLED and _has_text(result):
+        with _question_cache_lock:
+            variants = _cached_variants(key)
+            if result not in variants:
+                variants = (variants + (copy.deepcopy(result),))[-LLM_CACHE_VARIANTS:]
+            _question_cache.set(key, variants)
+        llm_disk_cache.set(key, variants)
+    return result
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
+
+def _generate_question(skill, difficulty, qtype, options, avoid=None):
+    prompt_text = PROMPTS.get(qtype, PROMPTS.get("mcq")).format(skill=skill, difficulty=difficulty, options=options)
+    if avoid:
+        # the same prompt at low temperature tends to return the same question
+        prompt_text += f"\nIt must be clearly different from this existing question: {avoid}"
 
     payload = {
         "model": OPENROUTER_MODEL,
         "messages": [
-            {"role": "system", "content": "You are a helpful interview question generator."},
+            _GEN_SYSTEM,
             {"role": "user", "content": prompt_text}
         ],
-        "temperature": 0.3,
+        "temperature": 0.7 if avoid else 0.3,
         "max_tokens": 250
     }
 
-    logger.info(f"Generating {qtype} question for skill={skill}, difficulty={difficulty}")
-    logger.debug(f"Using model: {OPENROUTER_MODEL}, URL: {OPENROUTER_URL}")
+    logger.info("Generating %s question for skill=%s, difficulty=%s", qtype, skill, difficulty)
+    logger.debug("Using model: %s, URL: %s", OPENROUTER_MODEL, OPENROUTER_URL)
     
     try:
-        resp = _session.post(OPENROUTER_URL, json=payload, headers=headers, timeout=60)
-        logger.debug(f"API response status: {resp.status_code}")
+        resp = _post(payload)
+        logger.debug("API response status: %s", resp.status_code)
         
         if resp.status_code != 200:
-            logger.error(f"API returned status {resp.status_code}: {resp.text}")
+            logger.error("API returned status %s: %s", resp.status_code, resp.text)
             return None
         
-        data = resp.json()
+        data = jsonutil.loads(resp.content)
     except requests.exceptions.RequestException as e:
-        logger.error(f"Network/Request error calling OpenRouter API: {str(e)}")
+        logger.error("Network/Request error calling OpenRouter API: %s", e)
         return None
     except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse API response as JSON: {str(e)}")
+        logger.error("Failed to parse API response as JSON: %s", e)
         return None
     except Exception as e:
-        logger.error(f"Unexpected error in generate_question: {str(e)}")
+        logger.error("Unexpected error in generate_question: %s", e)
         return None
 
     content = None
     try:
         content = data["choices"][0]["message"]["content"]
-        logger.debug(f"Received content from API (first 100 chars): {content[:100]}")
+        logger.debug("Received content from API (first 100 chars): %.100s", content)
     except Exception as e:
-        logger.error(f"Failed to extract content from API response: {str(e)}")
-        logger.debug(f"API response structure: {json.dumps(data)}")
+        logger.error("Failed to extract content from API response: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("API response structure: %s", json.dumps(data))
         return None
 
     parsed = _extract_json_from_text(content)
     if parsed is None:
-        logger.warning(f"Could not extract JSON from API response for {qtype}")
-        logger.debug(f"Raw content: {content}")
+        logger.warning("Could not extract JSON from API response for %s", qtype)
+        logger.debug("Raw content: %s", content)
         return None
 
-    # NORMALIZE OUTPUT HERE
-    if qtype == "mcq":
-        result = {
-            "question": parsed.get("prompt") or parsed.get("question") or parsed.get("prompt_text"),
-            "options": parsed.get("options", []),
-            "correct_answer": parsed.get("answer") or parsed.get("correct_answer")
-        }
-        logger.debug(f"MCQ generated: {result['question'][:80]}")
-        return result
-
-    if qtype == "coding":
-        result = {
-            "question": parsed.get("prompt") or parsed.get("question"),
-            "input_spec": parsed.get("input_spec"),
-            "output_spec": parsed.get("output_spec"),
-            "examples": parsed.get("examples", [])
-        }
-        logger.debug(f"Coding question generated: {result['question'][:80]}")
-        return result
-
-    if qtype == "audio":
-        result = {
-            "prompt_text": parsed.get("prompt_text") or parsed.get("prompt"),
-            "expected_keywords": parsed.get("expected_keywords", []),
-            "rubric": parsed.get("rubric")
-        }
-        logger.debug(f"Audio question generated: {result['prompt_text'][:80]}")
-        return result
-
-    if qtype == "video":
-        result = {
-            "prompt_text": parsed.get("prompt_text") or parsed.get("prompt"),
-            "rubric": parsed.get("rubric"),
-            "suggested_time_seconds": parsed.get("suggested_time_seconds", 60)
-        }
-        logger.debug(f"Video question generated: {result['prompt_text'][:80]}")
-        return result
-
-    logger.debug(f"Parsed result: {parsed}")
-    return parsed
+    return _normalize_question(qtype, parsed)
+
+
+# the model's JSON for one question -> the keys the app stores, by type
+def _normalize_mcq(parsed):
+    return {
+        "question": parsed.get("prompt") or parsed.get("question") or parsed.get("prompt_text"),
+        "options": parsed.get("options", []),
+        "correct_answer": parsed.get("answer") or parsed.get("correct_answer")
+    }
+
+
+def _normalize_coding(parsed):
+    return {
+        "question": parsed.get("prompt") or parsed.get("question"),
+        "input_spec": parsed.get("input_spec"),
+        "output_spec": parsed.get("output_spec"),
+        "examples": parsed.get("examples", [])
+    }
+
+
+def _normalize_audio(parsed):
+    return {
+        "prompt_text": parsed.get("prompt_text") or parsed.get("prompt"),
+        "expected_keywords": parsed.get("expected_keywords", []),
+        "rubric": parsed.get("rubric")
+    }
+
+
+def _normalize_video(parsed):
+    return {
+        "prompt_text": parsed.get("prompt_text") or parsed.get("prompt"),
+        "rubric": parsed.get("rubric"),
+        "suggested_time_seconds": parsed.get("suggested_time_seconds", 60)
+    }
+
+
+_NORMALIZERS = {"mcq": _normalize_mcq, "coding": _normalize_coding,
+                "audio": _normalize_audio, "video": _normalize_video}
+
+
+def _normalize_question(qtype, parsed):
+    """Map the model's JSON for one question onto the keys the app stores."""
+    normalize = _NORMALIZERS.get(qtype)
+    if normalize is None:
+        logger.debug("Parsed result: %s", parsed)
+        return parsed
+    result = normalize(parsed)
+    logger.debug("%s question generated: %.80s", qtype, result.get("question") or result.get("prompt_text"))
+    return result
+
+
+def generate_questions_batch(skill: str, difficulty: str, qtype: str, options: int = 4, count: int = 5):
+    """Generate `count` different questions of one kind with a single LLM request.
+
+    Cheaper than `count` generate_question() calls (the instructions are sent
+    once) but slower, since the reply is one long completion; meant for
+    background jobs. Returns a list of normalized questions, possibly shorter
+    than `count` (empty on failure) -- callers top up with generate_question().
+    """
+    prompt_text = PROMPTS.get(qtype, PROMPTS.get("mcq")).format(skill=skill, difficulty=difficulty, options=options)
+    prompt_text = _ONE_QUESTION_RE.sub(rf"Generate {count} different \1 questions", prompt_text, count=1)
+    prompt_text = prompt_text.replace(
+        "Return JSON ONLY with keys", f"Return JSON ONLY: an array of {count} objects, each with keys", 1)
+
+    payload = {
+        "model": OPENROUTER_MODEL,
+        "messages": [
+            _GEN_SYSTEM,
+            {"role": "user", "content": prompt_text}
+        ],
+        "temperature": 0.3,
+        "max_tokens": min(4000, 250 * count + 100)
+    }
+
+    logger.info("Generating %d %s questions for skill=%s, difficulty=%s in one request", count, qtype, skill, difficulty)
+    try:
+        resp = _post(payload)
+        if resp.status_code != 200:
+            logger.error("API returned status %s: %s", resp.status_code, resp.text)
+            return []
+        content = jsonutil.loads(resp.content)["choices"][0]["message"]["content"]
+    except Exception as e:
+        logger.error("Batch question generation failed: %s", e)
+        return []
+
+    parsed = _find_json(content or "", "[")
+    if not isinstance(parsed, list):
+        logger.warning("Batch generation reply was not a JSON array for %s", qtype)
+        return []
+    return [_normalize_question(qtype, item) for item in parsed[:count] if isinstance(item, dict)]
 
 
 def evaluate_answer(question_type: str, question_text: str, correct_answer: str, candidate_answer: str):
@@ -164,11 +375,6 @@ def evaluate_answer(question_type: str, question_text: str, correct_answer: str,
     Returns a structured JSON with evaluation result.
     """
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     if question_type == "mcq":
         eval_prompt = (
             f"You are an evaluator for multiple-choice questions.\n"
@@ -217,20 +423,89 @@ def evaluate_answer(question_type: str, question_text: str, correct_answer: str,
     payload = {
         "model": OPENROUTER_MODEL,
         "messages": [
-            {"role": "system", "content": "You are a strict and fair evaluator for technical questions."},
+            _EVAL_SYSTEM,
             {"role": "user", "content": eval_prompt}
         ],
         "temperature": 0.2,
         "max_tokens": 400
     }
 
-    resp = _session.post(OPENROUTER_URL, json=payload, headers=headers, timeout=60)
+    resp = _post(payload)
     resp.raise_for_status()
-    data = resp.json()
+    data = jsonutil.loads(resp.content)
 
     try:
         content = data["choices"][0]["message"]["content"]
         parsed = _extract_json_from_text(content)
         return parsed if parsed is not None else {"raw": content}
     except Exception:
-        return {"raw": content}
\ No newline at end of file
+        return {"raw": content}
+
+
+def evaluate_answers_batch(items):
+    """
+    Evaluate several MCQ/coding answers with a single LLM request.
+    `items` is a list of dicts with the evaluate_answer() keyword arguments.
+    Returns a list aligned with `items`; an entry is None when the model's reply
+    for it is missing or malformed, so the caller can fall back to evaluate_answer().
+    """
+    parts = []
+    for i, item in enumerate(items, 1):
+        if item["question_type"] == "mcq":
+            parts.append(
+                f"{i}. [mcq] Question: {item['question_text']}\n"
+                f"Correct Answer: {item['correct_answer']}\n"
+                f"Candidate Answer: {item['candidate_answer']}\n"
+                f"Return is_correct (true/false), score (0 or 1), feedback (short sentence)."
+            )
+        elif item["question_type"] == "coding":
+            parts.append(
+                f"{i}. [coding] Question: {item['question_text']}\n"
+                f"Expected Solution Description: {item['correct_answer']}\n"
+                f"Candidate Code:\n{item['candidate_answer']}\n"
+                f"Evaluate correctness and efficiency. Return score (0-10), feedback (short explanation)."
+            )
+        else:
+            raise ValueError("Unsupported question_type for batch evaluation")
+
+    eval_prompt = (
+        "You are an evaluator for multiple-choice and coding questions. "
+        "Evaluate each numbered item independently.\n\n"
+        + "\n\n".join(parts)
+        + "\n\nReturn JSON ONLY: an array with one object per item, in order, each with "
+        "key index (the item number) plus the keys requested for that item."
+    )
+
+    payload = {
+        "model": OPENROUTER_MODEL,
+        "messages": [
+            _EVAL_SYSTEM,
+            {"role": "user", "content": eval_prompt}
+        ],
+        "temperature": 0.2,
+        "max_tokens": min(4000, 150 * len(items) + 100)
+    }
+
+    resp = _post(payload)
+    resp.raise_for_status()
+    data = jsonutil.loads(resp.content)
+
+    content = data["choices"][0]["message"]["content"]
+    parsed = _extract_json_from_text(content)
+    if not isinstance(parsed, list):
+        parsed = _find_json(content or "", "[")
+    if not isinstance(parsed, list):
+        logger.warning("Batch evaluation reply was not a JSON array; falling back to per-answer calls")
+        return [None] * len(items)
+
+    results = [None] * len(items)
+    for pos, entry in enumerate(parsed):
+        if not isinstance(entry, dict):
+            continue
+        try:
+            i = int(entry.pop("index", pos + 1)) - 1
+        except (TypeError, ValueError):
+            i = pos
+        if 0 <= i < len(items) and results[i] is None:
+            results[i] = entry
+    return results
@@ -0,0 +1,54 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from utils import jsonutil
+
+logger = logging.getLogger(__name__)
+
+# opt-in: a file path shared by every worker (and by later runs), so dev and
+# test runs stop paying for the same generations; unset = disabled
+LLM_DISK_CACHE = os.getenv("LLM_DISK_CACHE")
+LLM_DISK_CACHE_TTL = int(os.getenv("LLM_DISK_CACHE_TTL", str(7 * 24 * 3600)))
+
+# sqlite3 connections can't be shared between threads
+_local = threading.local()
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(LLM_DISK_CACHE, timeout=5, isolation_level=None)
+        # readers don't block the writer (other workers may be writing)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS llm_cache "
+                     "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+        _local.conn = conn
+    return conn
+
+
+def get(key):
+    """Cached value for `key` (any JSON-serializable value), or None if missing or expired."""
+    if not LLM_DISK_CACHE:
+        return None
+    try:
+        row = _conn().execute("SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?",
+                              (jsonutil.dumps(key), time.time())).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("LLM disk cache read failed: %s", e)
+        return None
+    return jsonutil.loads(row[0]) if row else None
+
+
+def set(key, value):
+    """Store `value` for `key` for LLM_DISK_CACHE_TTL seconds; errors are logged, not raised."""
+    if not LLM_DISK_CACHE:
+        return
+    try:
+        _conn().execute("INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (jsonutil.dumps(key), jsonutil.dumps(value), time.time() + LLM_DISK_CACHE_TTL))
+    except sqlite3.Error as e:
+        logger.warning("LLM disk cache write failed: %s", e)
@@ -0,0 +1,36 @@
+import time
+import threading
+from collections import deque
+
+
+class WindowLimiter:
+    """Thread-safe sliding-window limiter: at most `limit` units per `window` seconds.
+
+    acquire() blocks until the cost fits, so callers queue up here instead of
+    being answered 429 and sleeping in urllib3's retry backoff. A limit of 0
+    disables it.
+    """
+
+    def __init__(self, limit, window=60.0):
+        self.limit = limit
+        self.window = window
+        self._spent = deque()  # (timestamp, cost)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        if self.limit <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._spent and self._spent[0][0] <= now - self.window:
+                    self._total -= self._spent.popleft()[1]
+                # a single call larger than the whole budget still goes through
+                # once the window is empty, instead of blocking forever
+                if not self._spent or self._total + cost <= self.limit:
+                    self._spent.append((now, cost))
+                    self._total += cost
+                    return
+                wait = self._spent[0][0] + self.window - now
+            time.sleep(max(wait, 0.01))
@@ -2,3 +2,10 @@ import uuid
 
 def gen_uuid():
     return str(uuid.uuid4())
+
+def parse_uuid(value):
+    """Canonical string form of `value` if it is a UUID, else None."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,65 @@
+import json
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib codec
+    orjson = None
+
+
+def dumps(obj, default=None):
+    """Serialize to a compact JSON str; `default` converts unsupported objects."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default).decode()
+        except TypeError:
+            # e.g. ints beyond 64 bits, which the stdlib codec still handles
+            pass
+    return json.dumps(obj, separators=(",", ":"), default=default)
+
+
+def loads(val):
+    """Parse JSON from str or bytes."""
+    if orjson is not None:
+        return orjson.loads(val)
+    return json.loads(val)
+
+
+def json_response(payload, status=200):
+    """Like jsonify(), but encoded in one pass with orjson when available."""
+    if orjson is not None:
+        try:
+            body = orjson.dumps(payload)
+        except TypeError:
+            body = json.dumps(payload)
+    else:
+        body = json.dumps(payload)
+    return Response(body, status=status, mimetype="application/json")
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider (jsonify, request.get_json) backed by orjson.
+
+    Output matches the default provider (sorted keys, dates as HTTP date
+    strings via its `default`) except that non-ASCII text is sent as UTF-8
+    instead of \\u escapes. Calls orjson can't serve, such as the indented
+    debug output, use the stdlib path.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {"separators"}:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
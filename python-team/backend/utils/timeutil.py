@@ -0,0 +1,19 @@
+import time
+from datetime import datetime, timezone
+
+
+def utcnow():
+    """Current UTC time as a naive datetime, i.e. what datetime.utcnow() returned.
+
+    Stored timestamps (and the expiry built from the user's endDate/endTime) are
+    naive, so this keeps them consistent without the deprecated call.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def utc_stamp():
+    """Current UTC time as YYYYmmddHHMMSS, for upload file names.
+
+    Goes straight through time.strftime, without building a datetime first.
+    """
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime())